@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# short commands the tooling runs, each timed from a fresh interpreter
+COMMANDS = {
+  "help":   ["--help"],
+  "list":   ["list"],
+  "search": ["list", "fire", "--filter", "LEVEL<=3", "--sort", "LEVEL"],
+  "parse":  ["list", "--cache", ""],
+}
+# commands that do not draw must start without these
+DRAWING_MODULES = ("cairo", "spell_cards", "character_writer", "surfaces",
+                   "output_store", "watcher", "colored")
+
+PROBE = """
+import contextlib, io, json, sys
+import main
+with contextlib.redirect_stdout(io.StringIO()):
+  try:
+    main.cli(sys.argv[1:])
+  except SystemExit:
+    pass
+print(json.dumps(sorted(set(sys.modules) & set(%r))))
+""" % (DRAWING_MODULES,)
+
+
+def run(args):
+  start = time.perf_counter()
+  subprocess.run([sys.executable, "main.py"] + args, cwd=ROOT,
+                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  return (time.perf_counter() - start) * 1000
+
+
+def drawing_modules(args):
+  probe = subprocess.run([sys.executable, "-c", PROBE] + args, cwd=ROOT,
+                         capture_output=True, text=True, check=True)
+  return json.loads(probe.stdout.splitlines()[-1])
+
+
+def measure(repeat=15):
+  # the first run compiles the catalogue and byte code, as any earlier
+  # call from the tooling would have
+  results = {}
+  for name, args in COMMANDS.items():
+    run(args)
+    times = sorted(run(args) for _ in range(repeat))
+    results[name] = {"median_ms": statistics.median(times),
+                     "min_ms": times[0],
+                     "drawing_modules": drawing_modules(args)}
+  return results
+
+
+def check(repeat=15):
+  # a command fails when it loads a drawing module. Timings depend on the
+  # machine and on the cairo build, so they are reported but not compared
+  # against a baseline
+  results = measure(repeat)
+  failed = {name: "imported " + ", ".join(result["drawing_modules"])
+            for name, result in results.items() if result["drawing_modules"]}
+  return results, failed
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Startup time regression check")
+  parser.add_argument("command", choices=["check", "show"])
+  parser.add_argument("--repeat", type=int, default=15)
+  args = parser.parse_args(argv)
+
+  if args.command == "show":
+    print(json.dumps(measure(args.repeat), indent=2))
+    return 0
+  results, failed = check(args.repeat)
+  print(json.dumps({"results": results, "failed": failed}, indent=2))
+  return 1 if failed else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
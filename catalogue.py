@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+
+from array import array
+from bisect import bisect_left, bisect_right
+import hashlib
+import operator
+import marshal
+import os
+import spells
+
+OPERATORS = ("eq", "ne", "in", "lt", "le", "gt", "ge")
+COMPARE = {"lt": operator.lt, "le": operator.le,
+           "gt": operator.gt, "ge": operator.ge}
+
+# bump whenever the saved layout or SpellRecord's fields change, so compiled
+# catalogues saved by older code are rebuilt
+CATALOGUE_VERSION = 3
+# columns built ahead of time since listing filters on them
+COMPILED_COLUMNS = ("LEVEL", "SCHOOL")
+# columns with at most this many distinct values keep a bitmap per value;
+# beyond it the bitmaps cost more memory than scanning the codes
+LOW_CARDINALITY = 64
+
+
+def to_number(value):
+  try:
+    return float(value)
+  except (TypeError, ValueError):
+    return None
+
+
+def matches(record, conditions):
+  # the same conditions evaluated on one record, for streams that are
+  # never held in a Catalogue
+  for field, op, value in conditions:
+    cell = record.get(field, "")
+    if op in ("eq", "ne", "in"):
+      items = value if op == "in" else (value,)
+      hit = any(cell.upper() == str(item).upper() for item in items)
+      if hit == (op == "ne"):
+        return False
+    else:
+      number = to_number(cell)
+      if number is None or not COMPARE[op](number, float(value)):
+        return False
+  return True
+
+
+def bitmap(rows, size):
+  bits = bytearray((size + 7) // 8)
+  for row in rows:
+    bits[row >> 3] |= 1 << (row & 7)
+  return int.from_bytes(bits, "little")
+
+
+def members(mask):
+  data = mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+  for byte_index, byte in enumerate(data):
+    while byte:
+      low = byte & -byte
+      yield byte_index * 8 + low.bit_length() - 1
+      byte ^= low
+
+
+# One field of the catalogue, dictionary encoded. Every row holds a code
+# into categories, so a predicate is evaluated once per distinct value.
+# Low cardinality columns also keep a bitmap of rows per category, built
+# the first time they are queried, and combine them with integer or; the
+# rest scan their codes for the matching ones.
+class Column:
+  def __init__(self, values):
+    index = {}
+    self.codes = array("L")
+    for value in values:
+      self.codes.append(index.setdefault(value, len(index)))
+    self.categories = list(index)
+    self.bitmaps = None
+    self.code_ranks = None
+
+    # numeric categories in order
+    numbered = sorted((to_number(value), code)
+                      for code, value in enumerate(self.categories)
+                      if to_number(value) is not None)
+    self.numbers = [number for number, code in numbered]
+    self.numbered_codes = [code for number, code in numbered]
+
+  def rows(self, codes):
+    # bitmap of the rows holding any of codes
+    codes = set(codes)
+    if not codes:
+      return 0
+    if len(self.categories) > LOW_CARDINALITY:
+      return bitmap((row for row, code in enumerate(self.codes) if code in codes),
+                    len(self.codes))
+    if self.bitmaps is None:
+      rows = [[] for _ in self.categories]
+      for row, code in enumerate(self.codes):
+        rows[code].append(row)
+      self.bitmaps = [bitmap(code_rows, len(self.codes)) for code_rows in rows]
+    mask = 0
+    for code in codes:
+      mask |= self.bitmaps[code]
+    return mask
+
+  def equal(self, *values):
+    values = {str(value).upper() for value in values}
+    return self.rows(code for code, category in enumerate(self.categories)
+                     if category.upper() in values)
+
+  def where(self, op, value, all_rows):
+    if op == "eq":
+      return self.equal(value)
+    if op == "ne":
+      return all_rows & ~self.equal(value)
+    if op == "in":
+      return self.equal(*value)
+    number = float(value)
+    if op == "lt":
+      return self.rows(self.numbered_codes[:bisect_left(self.numbers, number)])
+    if op == "le":
+      return self.rows(self.numbered_codes[:bisect_right(self.numbers, number)])
+    if op == "gt":
+      return self.rows(self.numbered_codes[bisect_right(self.numbers, number):])
+    if op == "ge":
+      return self.rows(self.numbered_codes[bisect_left(self.numbers, number):])
+    raise ValueError("unknown operator " + op)
+
+  def ranks(self):
+    # numbers sort numerically ahead of text, which sorts alphabetically;
+    # the rank of each code is worked out once and kept
+    if self.code_ranks is None:
+      order = sorted(range(len(self.categories)),
+                     key=lambda code: (to_number(self.categories[code]) is None,
+                                       to_number(self.categories[code]) or 0,
+                                       self.categories[code]))
+      self.code_ranks = array("L", [0] * len(order))
+      for rank, code in enumerate(order):
+        self.code_ranks[code] = rank
+    return self.code_ranks
+
+
+# Column store over a list of spell records, queried with conditions like
+# ("LEVEL", "le", 3) or keyword lookups like level__le=3.
+class Catalogue:
+  def __init__(self, records):
+    self.records = list(records)
+    self.all_rows = (1 << len(self.records)) - 1
+    self.columns = {}
+
+  def column(self, field):
+    if field not in self.columns:
+      self.columns[field] = Column([record.get(field, "") for record in self.records])
+    return self.columns[field]
+
+  def filter(self, *conditions, **lookups):
+    conditions = list(conditions)
+    for lookup, value in lookups.items():
+      field, _, op = lookup.partition("__")
+      conditions.append((field.upper(), op or "eq", value))
+    mask = self.all_rows
+    for field, op, value in conditions:
+      mask &= self.column(field).where(op, value, self.all_rows)
+      if not mask:
+        break
+    return mask
+
+  def select(self, mask=None, sort=(), reverse=False):
+    rows = list(members(self.all_rows if mask is None else mask))
+    if isinstance(sort, str):
+      sort = (sort,)
+    if sort:
+      keys = [(self.column(field).codes, self.column(field).ranks())
+              for field in sort]
+      rows.sort(key=lambda row: tuple(ranks[codes[row]] for codes, ranks in keys),
+                reverse=reverse)
+    return [self.records[row] for row in rows]
+
+  def query(self, *conditions, sort=(), reverse=False, **lookups):
+    return self.select(self.filter(*conditions, **lookups), sort, reverse)
+
+
+def compile_csv(path):
+  headers, records = spells.read_csv(path)
+  index = Catalogue(records.values())
+  for field in COMPILED_COLUMNS:
+    index.column(field)
+  return headers, index
+
+
+def default_cache_dir():
+  # compiled catalogues live with the user's other caches, never in the
+  # working directory, where anyone able to write there could plant one
+  base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+    os.path.expanduser("~"), ".cache")
+  return os.path.join(base, "taprunes", "catalogues")
+
+
+def compiled(path, cache_dir=None):
+  # (headers, Catalogue) for a csv. Given a cache_dir, the csv is parsed
+  # and validated once and its records saved there with marshal, which only
+  # holds strings and lists; later calls load them back for as long as the
+  # file keeps its size and modification time. Without one the csv is
+  # parsed every time and nothing is written.
+  if path == "-" or not cache_dir:
+    return compile_csv(path)
+  info = os.stat(path)
+  stamp = [CATALOGUE_VERSION, os.path.abspath(path), info.st_size,
+           info.st_mtime_ns]
+  cache = os.path.join(cache_dir,
+                       hashlib.sha256(stamp[1].encode()).hexdigest()[:16] + ".marshal")
+  try:
+    with open(cache, "rb") as infile:
+      saved = marshal.loads(infile.read())
+    if saved[0] == stamp:
+      index = Catalogue(spells.SpellRecord.restored(zip(fields, values), errors)
+                        for fields, values, errors in saved[2])
+      for field in COMPILED_COLUMNS:
+        index.column(field)
+      return saved[1], index
+  except (OSError, EOFError, ValueError, TypeError, IndexError, KeyError):
+    pass
+
+  headers, index = compile_csv(path)
+  rows = [[record.keys(), [record[field] for field in record.keys()],
+           list(record.errors)] for record in index.records]
+  try:
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = cache + "." + str(os.getpid())
+    with open(tmp, "wb") as out:
+      out.write(marshal.dumps([stamp, headers, rows]))
+    os.replace(tmp, cache)
+  except OSError:
+    # an unwritable cache still works, it just parses the csv every time
+    pass
+  return headers, index
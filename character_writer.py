@@ -1,7 +1,26 @@
 #!/usr/bin/env python
 
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import functools
 import math
+import os
 import cairo
+import display_list as DL
+from render_state import RenderState
+import path_cache
+import png_writer
+import surfaces
+import text_layout
+
+
+def polygon_outlines(upper):
+  # the lower half of every polygon style mirrors the upper half, and the
+  # full outline runs along the top and back along the bottom
+  lower = [(x, -y) for x, y in reversed(upper)]
+  return {"up":   tuple(upper),
+          "down": tuple(lower),
+          "full": tuple(upper + lower[1:])}
 
 
 class CharacterWriter:
@@ -9,35 +28,59 @@ class CharacterWriter:
   LINE_WIDTH = int(CHAR_WIDTH / 12)
   XPAD, YPAD = LINE_WIDTH * 2, LINE_WIDTH * 4
 
-  STYLES = {"curved":   0,
-            "diamond":  1,
-            "square":   2,
-            "hex1":     3,
-            "hex2":     4,
-            "chamfer":  5,
-            "octogon":  6}
+  STYLES = {name: code for code, name in enumerate(text_layout.STYLES)}
+
+  # unit outlines for the non-curved styles, scaled by the arc radius
+  POLYGONS = {
+    STYLES["diamond"]: polygon_outlines([(-1, 0), (0, -1), (1, 0)]),
+    STYLES["square"]:  polygon_outlines([(-1, 0), (-1, -1), (1, -1), (1, 0)]),
+    STYLES["hex1"]:    polygon_outlines([(-1, 0), (-1/2, -1), (1/2, -1), (1, 0)]),
+    STYLES["hex2"]:    polygon_outlines([(-1, 0), (-1, -1/2), (0, -1), (1, -1/2),
+                                         (1, 0)]),
+    STYLES["chamfer"]: polygon_outlines([(-1, 0), (-1, -2/3), (-2/3, -1),
+                                         (2/3, -1), (1, -2/3), (1, 0)]),
+    STYLES["octogon"]: polygon_outlines([(-1, 0), (-1, -1/2), (-1/2, -1),
+                                         (1/2, -1), (1, -1/2), (1, 0)])
+  }
 
   def __init__(self,
          scale,
          char_width=1,
          char_height=1,
          ctx=None,
-         surface=None):
-    self.process_scale(scale)
-    self.cursor_x = self.XPAD + self.x_scaled / 2
-    self.cursor_y = self.YPAD
+         surface=None,
+         record=False,
+         profiler=None,
+         draft=False,
+         display_list=False):
+    self.record = record
+    # with display_list the page is recorded as a DL.DisplayList, which
+    # exports to svg, json or png
+    self.display_list = display_list
+    self.profiler = profiler
+    self.batched = False
+    # a draft page is smaller, antialiased with draft (True, "fast" or
+    # "none") and inked in one colour
+    self.draft = draft
+    if draft and ctx is None:
+      scale *= surfaces.DRAFT_SCALE
+    self.state = self.state_for_scale(scale)
+    self.cursor_x = self.state.XPAD + self.state.x_scaled / 2
+    self.cursor_y = self.state.YPAD
     self.x_home = self.cursor_x
     self.y_home = self.cursor_y
     if ctx is not None and surface is not None:
       self.ctx = ctx
       self.surface = surface
-      self.ctx.set_line_width(self.LINE_WIDTH)
+      self.ctx.set_line_width(self.state.LINE_WIDTH)
       self.ctx.set_line_join(cairo.LINE_JOIN_ROUND)
       self.ctx.set_line_cap(cairo.LINE_CAP_ROUND)
     else:
       self.generate_default_context(char_width, char_height)
     self.style = self.STYLES["curved"]
+    self.bind_runes()
 
+  def bind_runes(self):
     self.runes = {
       "A": self.A,
       "B": self.B,
@@ -131,53 +174,96 @@ class CharacterWriter:
       5: self.FIVE
     }
 
+    if self.profiler is not None:
+      self.runes = {rune: self.profiler.wrap(self, rune, draw)
+                    for rune, draw in self.runes.items()}
+      self.numeric_runes = {digit: self.profiler.wrap(self, "#%d" % digit, draw)
+                            for digit, draw in self.numeric_runes.items()}
+
+  def state_for_scale(self, scale):
+    return RenderState.for_glyph(self.CHAR_WIDTH, self.CHAR_HEIGHT,
+                                 self.LINE_WIDTH, self.XPAD, self.YPAD, scale)
+
+  def canvas_size(self, state, char_width, char_height):
+    pixel_width = int(char_width * (state.x_scaled + state.XPAD) +
+              2 * state.LINE_WIDTH)
+    pixel_height = int(char_height * (state.y_scaled + state.YPAD) +
+               2 * state.LINE_WIDTH)
+    return pixel_width, pixel_height
+
   def generate_default_context(self, char_width, char_height):
-    pixel_width = int(char_width * (self.x_scaled + self.XPAD) +
-              2 * self.LINE_WIDTH)
-    pixel_height = int(char_height * (self.y_scaled + self.YPAD) +
-               2 * self.LINE_WIDTH)
-    self.surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, pixel_width,
-                      pixel_height)
-    ctx = cairo.Context(self.surface)
-
-    pat = cairo.LinearGradient(0.0, 0.0, 0.0, pixel_height)
-    # add_color_stop_rbga(offset, % red, % green, % blue, % opacity)
-    pat.add_color_stop_rgba(1, 224/255, 160/255, 255/255, 1)
-    pat.add_color_stop_rgba(0.5, 170/255, 207/255, 255/255, 1)
-    pat.add_color_stop_rgba(0, 175/255, 31/255, 255/255, 1)
-
-    ctx.set_source_rgb(5/255, 21/255, 9/255)
-    ctx.rectangle(0,0,pixel_width, pixel_height)
-    ctx.fill() 
-
-    ctx.set_source(pat)
+    self.char_width, self.char_height = char_width, char_height
+    pixel_width, pixel_height = self.canvas_size(self.state, char_width,
+                                                 char_height)
+    if self.display_list:
+      self.surface = DL.DisplayList(pixel_width, pixel_height, BACKGROUND)
+      ctx = self.surface
+    else:
+      self.surface = surfaces.new_filled_surface(pixel_width, pixel_height,
+                                                 BACKGROUND,
+                                                 record=self.record)
+      ctx = cairo.Context(self.surface)
+    if self.draft:
+      ctx.set_antialias(surfaces.draft_antialias(self.draft))
+      ctx.set_source_rgb(*DRAFT_INK)
+    else:
+      ctx.set_source(ink_gradient(pixel_height))
     self.ctx = ctx
 
-    self.ctx.set_line_width(self.LINE_WIDTH)
+    self.ctx.set_line_width(self.state.LINE_WIDTH)
     self.ctx.set_line_cap(cairo.LINE_CAP_ROUND)
 
-  def export_image(self, filename="example.png"):
-    self.surface.write_to_png(filename)  # Output to PNG
-
-  def process_scale(self, scale):
-    self.scale = scale
-    self.x_scaled = self.CHAR_WIDTH * scale
-    self.y_scaled = self.CHAR_HEIGHT * scale
-    self.XPAD *= scale
-    self.YPAD *= scale
-    self.LINE_WIDTH *= scale
+  def export_image(self, filename="example.png", indexed=False):
+    if self.display_list:
+      self.surface.optimized().export(filename,
+                                      self.index_palette() if indexed else None)
+    elif indexed:
+      image = self.rasterize([self.state.scale])[0] if self.record else self.surface
+      png_writer.write_indexed_png(image, filename, self.index_palette())
+    elif self.record:
+      self.rasterize([self.state.scale])[0].write_to_png(filename)
+    else:
+      self.surface.write_to_png(filename)  # Output to PNG
+
+  def index_palette(self):
+    return png_writer.derive_palette([rgb for offset, rgb in INK_STOPS],
+                                     BACKGROUND)
+
+  def rasterize(self, scales):
+    images = []
+    for scale in scales:
+      width, height = self.canvas_size(self.state_for_scale(scale),
+                                       self.char_width, self.char_height)
+      images.append(surfaces.replay(self.surface, scale / self.state.scale,
+                                    width, height))
+    return images
+
+  def export_images(self, filenames):
+    scales = list(filenames)
+    for scale, image in zip(scales, self.rasterize(scales)):
+      image.write_to_png(filenames[scale])
+
+  def with_state(self, state):
+    writer = copy.copy(self)
+    writer.state = state
+    writer.bind_runes()
+    return writer
+
+  def scaled(self, scale):
+    return self.with_state(self.state.rescaled(self.CHAR_WIDTH,
+                                               self.CHAR_HEIGHT, scale))
 
   def rel_to_user_x(self, rel_x):
-    return rel_x * self.x_scaled + self.cursor_x
+    return rel_x * self.state.x_scaled + self.cursor_x
 
   def rel_to_user_y(self, rel_y):
-    return rel_y * self.y_scaled + self.cursor_y
+    return rel_y * self.state.y_scaled + self.cursor_y
 
   def advance_cursor(self):
-    self.cursor_x += self.XPAD + self.x_scaled
+    self.cursor_x += self.state.XPAD + self.state.x_scaled
 
   def line_feed(self):
-    self.cursor_y += self.YPAD + self.y_scaled
+    self.cursor_y += self.state.YPAD + self.state.y_scaled
 
   def carriage_return(self):
     self.cursor_x = self.x_home
@@ -196,14 +282,23 @@ class CharacterWriter:
     self.line_return()
 
   def stroke(self):
-    self.ctx.stroke()
+    # runes share one source and pen, so their strokes are batched into one
+    # path and rasterized once by flush(). Ending the sub path leaves no
+    # current point, as a real stroke would.
+    if self.ctx.has_current_point():
+      self.batched = True
+    self.ctx.new_sub_path()
+
+  def flush(self):
+    if self.batched or self.ctx.has_current_point():
+      self.ctx.stroke()
+    self.batched = False
 
   def init_char(self, rel_x=0, rel_y=0):
-    self.ctx.new_path()
     self.move_to(rel_x, rel_y)
 
   def vert(self, len):
-    self.ctx.rel_line_to(0, len * self.y_scaled)
+    self.ctx.rel_line_to(0, len * self.state.y_scaled)
 
   def v_to_bottom(self):
     x, y = self.ctx.get_current_point()
@@ -244,160 +339,41 @@ class CharacterWriter:
 
   def arc(self, rel_x, rel_y, rad, angle_1, angle_2):
     if self.style == self.STYLES["curved"]:
+      # curved arcs are stroked on their own through the glyph's scale,
+      # which gives them an elliptical pen, so the batch is flushed first
+      self.flush()
       self.ctx.save()
       self.ctx.new_sub_path()
       self.ctx.translate(self.cursor_x, self.cursor_y)
-      self.ctx.scale(self.x_scaled, self.y_scaled)
-      self.ctx.set_line_width(self.LINE_WIDTH / self.x_scaled * 0.75)
+      self.ctx.scale(self.state.x_scaled, self.state.y_scaled)
+      self.ctx.set_line_width(self.state.LINE_WIDTH / self.state.x_scaled * 0.75)
       self.ctx.arc(rel_x, rel_y, rad, angle_1, angle_2)
-      self.stroke()
+      self.ctx.stroke()
       self.ctx.restore()
     else:
-      if self.style == self.STYLES["diamond"]:
-        if (angle_2 == angle_1 + 2 * math.pi):  # circle
-          self.move_to(rel_x - rad, rel_y)
-          self.line_to(rel_x, rel_y - rad)
-          self.line_to(rel_x + rad, rel_y)
-
-          self.line_to(rel_x, rel_y + rad)
-          self.line_to(rel_x - rad, rel_y)
-        elif (angle_1 == 0):  # half down
-          self.move_to(rel_x + rad, rel_y)
-          self.line_to(rel_x, rel_y + rad)
-          self.line_to(rel_x - rad, rel_y)
-        else:  # half up
-          self.move_to(rel_x - rad, rel_y)
-          self.line_to(rel_x, rel_y - rad)
-          self.line_to(rel_x + rad, rel_y)
-      elif self.style == self.STYLES["square"]:
-        if (angle_2 == angle_1 + 2 * math.pi):  # circle
-          self.move_to(rel_x - rad, rel_y)
-          self.line_to(rel_x - rad, rel_y - rad)
-          self.line_to(rel_x + rad, rel_y - rad)
-          self.line_to(rel_x + rad, rel_y)
-
-          self.line_to(rel_x + rad, rel_y + rad)
-          self.line_to(rel_x - rad, rel_y + rad)
-          self.line_to(rel_x - rad, rel_y)
-        elif (angle_1 == 0):  # half down
-          self.move_to(rel_x + rad, rel_y)
-
-          self.line_to(rel_x + rad, rel_y + rad)
-          self.line_to(rel_x - rad, rel_y + rad)
-          self.line_to(rel_x - rad, rel_y)
-        else:  # half up
-          self.move_to(rel_x - rad, rel_y)
-          self.line_to(rel_x - rad, rel_y - rad)
-          self.line_to(rel_x + rad, rel_y - rad)
-          self.line_to(rel_x + rad, rel_y)
-      elif self.style == self.STYLES["hex1"]:
-        if (angle_2 == angle_1 + 2 * math.pi):  # circle
-          self.move_to(rel_x - rad, rel_y)
-          self.line_to(rel_x - rad / 2, rel_y - rad)
-          self.line_to(rel_x + rad / 2, rel_y - rad)
-          self.line_to(rel_x + rad, rel_y)
-          self.line_to(rel_x + rad / 2, rel_y + rad)
-          self.line_to(rel_x - rad / 2, rel_y + rad)
-          self.line_to(rel_x - rad, rel_y)
-        elif (angle_1 == 0):  # half down
-          self.move_to(rel_x + rad, rel_y)
-          self.line_to(rel_x + rad / 2, rel_y + rad)
-          self.line_to(rel_x - rad / 2, rel_y + rad)
-          self.line_to(rel_x - rad, rel_y)
-        else:  # half up
-          self.move_to(rel_x - rad, rel_y)
-          self.line_to(rel_x - rad / 2, rel_y - rad)
-          self.line_to(rel_x + rad / 2, rel_y - rad)
-          self.line_to(rel_x + rad, rel_y)
-      elif self.style == self.STYLES["hex2"]:
-        if (angle_2 == angle_1 + 2 * math.pi):  # circle
-          self.move_to(rel_x - rad, rel_y)
-          self.line_to(rel_x - rad, rel_y - rad/2)
-          self.line_to(rel_x, rel_y - rad)
-          self.line_to(rel_x + rad, rel_y - rad/2)
-          self.line_to(rel_x + rad, rel_y)
-
-          self.line_to(rel_x + rad, rel_y + rad/2)
-          self.line_to(rel_x, rel_y + rad)
-          self.line_to(rel_x - rad, rel_y + rad/2)
-          self.line_to(rel_x - rad, rel_y)
-        elif (angle_1 == 0):  # half down
-          self.move_to(rel_x + rad, rel_y)
-          self.line_to(rel_x + rad, rel_y + rad/2)
-          self.line_to(rel_x, rel_y + rad)
-          self.line_to(rel_x - rad, rel_y + rad/2)
-          self.line_to(rel_x - rad, rel_y)
-        else:  # half up
-          self.move_to(rel_x - rad, rel_y)
-          self.line_to(rel_x - rad, rel_y - rad/2)
-          self.line_to(rel_x, rel_y - rad)
-          self.line_to(rel_x + rad, rel_y - rad/2)
-          self.line_to(rel_x + rad, rel_y)
-      elif self.style == self.STYLES["chamfer"]:
-        if (angle_2 == angle_1 + 2 * math.pi):  # circle
-          self.move_to(rel_x - rad, rel_y)
-          self.line_to(rel_x - rad, rel_y - 2*rad/3)
-          self.line_to(rel_x - 2*rad/3, rel_y - rad)
-          self.line_to(rel_x + 2*rad/3, rel_y - rad)
-          self.line_to(rel_x + rad, rel_y - 2*rad/3)
-          self.line_to(rel_x + rad, rel_y)
-
-          self.line_to(rel_x + rad, rel_y + 2*rad/3)
-          self.line_to(rel_x + 2*rad/3, rel_y + rad)
-          self.line_to(rel_x - 2*rad/3, rel_y + rad)
-          self.line_to(rel_x - rad, rel_y + 2*rad/3)
-          self.line_to(rel_x - rad, rel_y)
-        elif (angle_1 == 0):  # half down
-          self.move_to(rel_x + rad, rel_y)
-
-          self.line_to(rel_x + rad, rel_y + 2*rad/3)
-          self.line_to(rel_x + 2*rad/3, rel_y + rad)
-          self.line_to(rel_x - 2*rad/3, rel_y + rad)
-          self.line_to(rel_x - rad, rel_y + 2*rad/3)
-          self.line_to(rel_x - rad, rel_y)
-        else:  # half up
-          self.move_to(rel_x - rad, rel_y)
-          self.line_to(rel_x - rad, rel_y - 2*rad/3)
-          self.line_to(rel_x - 2*rad/3, rel_y - rad)
-          self.line_to(rel_x + 2*rad/3, rel_y - rad)
-          self.line_to(rel_x + rad, rel_y - 2*rad/3)
-          self.line_to(rel_x + rad, rel_y)
-
-      else:  # self.styles["octogon"]
-        if (angle_2 == angle_1 + 2 * math.pi):  # circle
-          self.move_to(rel_x - rad, rel_y)
-          self.line_to(rel_x - rad, rel_y - rad/2)
-          self.line_to(rel_x - rad/2, rel_y - rad)
-          self.line_to(rel_x + rad/2, rel_y - rad)
-          self.line_to(rel_x + rad, rel_y - rad/2)
-          self.line_to(rel_x + rad, rel_y)
-
-          self.line_to(rel_x + rad, rel_y + rad/2)
-          self.line_to(rel_x + rad/2, rel_y + rad)
-          self.line_to(rel_x - rad/2, rel_y + rad)
-          self.line_to(rel_x - rad, rel_y + rad/2)
-          self.line_to(rel_x - rad, rel_y)
-        elif (angle_1 == 0):  # half down
-          self.move_to(rel_x + rad, rel_y)
-
-          self.line_to(rel_x + rad, rel_y + rad/2)
-          self.line_to(rel_x + rad/2, rel_y + rad)
-          self.line_to(rel_x - rad/2, rel_y + rad)
-          self.line_to(rel_x - rad, rel_y + rad/2)
-          self.line_to(rel_x - rad, rel_y)
-        else:  # half up
-          self.move_to(rel_x - rad, rel_y)
-          self.line_to(rel_x - rad, rel_y - rad/2)
-          self.line_to(rel_x - rad/2, rel_y - rad)
-          self.line_to(rel_x + rad/2, rel_y - rad)
-          self.line_to(rel_x + rad, rel_y - rad/2)
-          self.line_to(rel_x + rad, rel_y)
+      if (angle_2 == angle_1 + 2 * math.pi):  # circle
+        outline = "full"
+      elif (angle_1 == 0):  # half down
+        outline = "down"
+      else:  # half up
+        outline = "up"
+      style = self.style if self.style in self.POLYGONS else self.STYLES["octogon"]
+      path = polygon_path(style, outline, rad, self.state.x_scaled,
+                          self.state.y_scaled)
+      self.append_path_at(path, self.rel_to_user_x(rel_x),
+                          self.rel_to_user_y(rel_y))
+
+  def append_path_at(self, path, x, y):
+    matrix = self.ctx.get_matrix()
+    self.ctx.translate(x, y)
+    self.ctx.append_path(path)
+    self.ctx.set_matrix(matrix)
 
   def move_to(self, rel_x, rel_y):
     self.ctx.move_to(self.rel_to_user_x(rel_x), self.rel_to_user_y(rel_y))
 
   def rel_move(self, dx, dy):
-    self.ctx.rel_move_to(dx * self.x_scaled, dy * self.y_scaled)
+    self.ctx.rel_move_to(dx * self.state.x_scaled, dy * self.state.y_scaled)
 
   def line_to(self, rel_x, rel_y):
     self.ctx.line_to(self.rel_to_user_x(rel_x), self.rel_to_user_y(rel_y))
@@ -407,29 +383,15 @@ class CharacterWriter:
     self.line_to(x2, y2)
 
   def curve_to(self, init_x, init_y, x1, y1, x2, y2, x3, y3):
-    self.move_to(init_x, init_y)
     if self.style == self.STYLES["curved"]:
+      self.move_to(init_x, init_y)
       self.ctx.curve_to(self.rel_to_user_x(x1), self.rel_to_user_y(y1),
                         self.rel_to_user_x(x2), self.rel_to_user_y(y2),
                         self.rel_to_user_x(x3), self.rel_to_user_y(y3))
     else:
-      if (init_x <= x1 <= x2 <= x3 or x3 <= x2 <= x1 <= init_x):
-        if init_y < 0.5:
-          self.line_to(x1, y1/2)
-          self.line_to(x2, y2/2)
-          self.line_to(x3, y3)
-        else:
-          self.line_to(x1, y1/2 + 0.5)
-          self.line_to(x2, y2/2 + 0.5)
-          self.line_to(x3, y3)
-      elif (init_y <= y1 <= y2 <= y3 or y3 <= y2 <= y1 <= init_y):
-        self.line_to(x1 / 2, y1)
-        self.line_to(x2 / 2, y2)
-        self.line_to(x3, y3)
-      else:
-        self.line_to(x1, y1)
-        self.line_to(x2, y2)
-        self.line_to(x3, y3)
+      path = curve_path(self.state.x_scaled, self.state.y_scaled,
+                        init_x, init_y, x1, y1, x2, y2, x3, y3)
+      self.append_path_at(path, self.cursor_x, self.cursor_y)
 
   def bottom_triangle(self):
     self.move_to(0, 0.5)
@@ -1180,6 +1142,10 @@ class CharacterWriter:
       self.advance_cursor()
 
   def write_numeric_rune(self, rune):
+    self.draw_numeric_rune(rune)
+    self.advance_cursor()
+
+  def draw_numeric_rune(self, rune):
     rune_val = int(rune)
     high = rune_val // 36
     rune_val -= high * 36
@@ -1196,7 +1162,6 @@ class CharacterWriter:
     self.numeric_runes[low]()
 
     self.cursor_y = y_pos
-    self.advance_cursor()
 
   def write_inscription(self, inscription):
     for rune in inscription:
@@ -1204,6 +1169,16 @@ class CharacterWriter:
         self.write_rune(rune)
       elif rune.isnumeric():
         self.write_numeric_rune(rune)
+    self.flush()
+
+  def write_glyphs(self, glyphs):
+    for rune, x, y in glyphs:
+      self.cursor_x, self.cursor_y = x, y
+      if rune in self.runes:
+        self.runes[rune]()
+      else:
+        self.draw_numeric_rune(rune)
+    self.flush()
 
   def parse_inscription(self, string):
     inscription = []
@@ -1222,29 +1197,160 @@ class CharacterWriter:
         inscription.append(char)
     return inscription
 
+  def parse_lines(self, infile):
+    # one inscription per line of an open file, read as they are asked for
+    for line in infile:
+      yield self.parse_inscription(line)
+
   def parse_file(self, filename):
     with open(filename, "r") as infile:
-      lines = infile.readlines()
-    inscription_lines = []
-    for line in lines:
-      inscription_lines.append(self.parse_inscription(line))
-    insc_width = len(max(inscription_lines, key=len))
-    insc_height = len(inscription_lines)
+      inscription_lines = list(self.parse_lines(infile))
+    insc_width, insc_height = text_layout.measure(self, inscription_lines)
     return insc_width, insc_height, inscription_lines
 
 
+@functools.lru_cache(maxsize=1024)
+def polygon_path(style, outline, rad, x_scaled, y_scaled):
+  points = [(x * rad * x_scaled, y * rad * y_scaled)
+            for x, y in CharacterWriter.POLYGONS[style][outline]]
+  return path_cache.polyline_path(points)
+
+
+@functools.lru_cache(maxsize=1024)
+def curve_path(x_scaled, y_scaled, init_x, init_y, x1, y1, x2, y2, x3, y3):
+  # non-curved styles stand a curve in with a polyline through its
+  # control points, squashed toward the axis the curve runs along
+  if (init_x <= x1 <= x2 <= x3 or x3 <= x2 <= x1 <= init_x):
+    if init_y < 0.5:
+      points = [(x1, y1/2), (x2, y2/2)]
+    else:
+      points = [(x1, y1/2 + 0.5), (x2, y2/2 + 0.5)]
+  elif (init_y <= y1 <= y2 <= y3 or y3 <= y2 <= y1 <= init_y):
+    points = [(x1 / 2, y1), (x2 / 2, y2)]
+  else:
+    points = [(x1, y1), (x2, y2)]
+  points = [(init_x, init_y)] + points + [(x3, y3)]
+  return path_cache.polyline_path([(x * x_scaled, y * y_scaled)
+                                   for x, y in points])
+
+
+BACKGROUND = (5/255, 21/255, 9/255)
+INK_STOPS = ((1, (224/255, 160/255, 255/255)),
+             (0.5, (170/255, 207/255, 255/255)),
+             (0, (175/255, 31/255, 255/255)))
+DRAFT_INK = INK_STOPS[1][1]
+
+
+@functools.lru_cache(maxsize=16)
+def ink_gradient(pixel_height):
+  pat = cairo.LinearGradient(0.0, 0.0, 0.0, pixel_height)
+  # add_color_stop_rbga(offset, % red, % green, % blue, % opacity)
+  for offset, (r, g, b) in INK_STOPS:
+    pat.add_color_stop_rgba(offset, r, g, b, 1)
+  return pat
+
+
 def main():
 
   cw = CharacterWriter(1)
   cw.style = cw.STYLES["hex2"]
-  width, height, insc_lines = cw.parse_file("input.txt")
-  cw.generate_default_context(width, height)
-  for inscription in insc_lines:
-    cw.write_inscription(inscription)
+  insc_lines = cw.parse_file("input.txt")[2]
+  page = text_layout.layout(cw, insc_lines)[0]
+  cw.generate_default_context(page.columns, page.rows)
+  cw.write_glyphs(page.glyphs)
 
   cw.export_image("output" + ".png")
 
 
+def render_style(insc_lines, width, height, style, scale=1):
+  with surfaces.render():
+    cw = CharacterWriter(scale)
+    cw.style = cw.STYLES[style]
+    cw.generate_default_context(width, height)
+    for inscription in insc_lines:
+      cw.write_inscription(inscription)
+  return cw
+
+
+def style_sheet(infile="input.txt", outfile="styles.png", styles=None,
+                scale=1, jobs=None, separate=False):
+  styles = list(styles or CharacterWriter.STYLES)
+  width, height, insc_lines = CharacterWriter(scale).parse_file(infile)
+  with ThreadPoolExecutor(max_workers=jobs) as pool:
+    writers = list(pool.map(lambda style: render_style(insc_lines, width,
+                                                       height, style, scale),
+                            styles))
+
+  if separate:
+    stem, ext = os.path.splitext(outfile)
+    outfiles = [stem + "_" + style + ext for style in styles]
+    for cw, name in zip(writers, outfiles):
+      cw.export_image(name)
+    return outfiles
+
+  label_height = int(24 * scale)
+  sheet_width = max(cw.surface.get_width() for cw in writers)
+  sheet_height = sum(cw.surface.get_height() + label_height for cw in writers)
+  sheet = surfaces.new_filled_surface(sheet_width, sheet_height,
+                                      BACKGROUND)
+  ctx = cairo.Context(sheet)
+  ctx.set_font_size(label_height * 0.75)
+  y = 0
+  for style, cw in zip(styles, writers):
+    ctx.set_source_rgb(224/255, 160/255, 255/255)
+    ctx.move_to(cw.state.XPAD, y + label_height * 0.8)
+    ctx.show_text(style)
+    y += label_height
+    ctx.set_source_surface(cw.surface, 0, y)
+    ctx.paint()
+    y += cw.surface.get_height()
+  sheet.write_to_png(outfile)
+  return [outfile]
+
+
+def write_pdf(insc_lines, outfile, columns=40, rows_per_page=40,
+              style="curved", scale=1, align="left"):
+  surface = cairo.PDFSurface(outfile, 1, 1)
+  cw = CharacterWriter(scale, ctx=cairo.Context(surface), surface=surface)
+  cw.style = cw.STYLES[style]
+  page_count = 0
+  for page in text_layout.pages(cw, insc_lines, columns, align,
+                                rows_per_page):
+    width, height = cw.canvas_size(cw.state, page.columns, rows_per_page)
+    surface.set_size(width, height)
+    cw.ctx.set_source_rgb(*BACKGROUND)
+    cw.ctx.rectangle(0, 0, width, height)
+    cw.ctx.fill()
+    cw.ctx.set_source(ink_gradient(height))
+    cw.write_glyphs(page.glyphs)
+    surface.show_page()
+    page_count += 1
+  surface.finish()
+  return page_count
+
+
+def translate_file(infile, outfile, style="curved", scale=1, columns=None,
+                   rows_per_page=40, align="left", indexed=False, draft=False):
+  # drafts only change raster output; pdf pages are vectors either way
+  cw = CharacterWriter(scale, draft=draft,
+                       display_list=outfile.endswith(DL.EXTENSIONS))
+  if outfile.endswith(".pdf"):
+    # pages are a fixed size, so the text is read, laid out and written a
+    # page at a time
+    with open(infile, "r") as lines:
+      write_pdf(cw.parse_lines(lines), outfile, columns or 40, rows_per_page,
+                style, scale, align)
+    return outfile
+  insc_lines = cw.parse_file(infile)[2]
+  cw.style = cw.STYLES[style]
+  page = text_layout.layout(cw, insc_lines, columns, align)[0]
+  with surfaces.render():
+    cw.generate_default_context(page.columns, page.rows)
+    cw.write_glyphs(page.glyphs)
+    cw.export_image(outfile, indexed=indexed)
+  return outfile
+
+
 def debug_print():
   cw = CharacterWriter(1)
 
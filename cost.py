@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import heapq
+import os
+import sigils
+
+# Rough render cost in path operations, worked out from the fields of a job
+# without drawing it; only the save frames are compiled, once per process.
+# Only the order of the estimates matters; they are used to hand the
+# longest jobs to the pool first.
+
+# mean path operations per rune across the character styles
+RUNE_OPS = 5
+# the name, sigil circles, C/R sigil and components around every card
+CARD_OPS = 40
+# a card is 560 x 600 pixels at scale 1, and a text cell about 60 x 100
+CARD_PIXELS = 560 * 600
+CELL_PIXELS = 60 * 100
+# path operations costing as much as filling one pixel of the canvas
+PIXEL_COST = 1 / 4000
+INSCRIBED = ("NAME", "LEVEL", "RANGE", "DAMAGE", "CASTINGTIME", "DURATION",
+             "TARGET")
+
+
+def ops_cost(ops, pixels, scale):
+  # strokes grow with the scale along one axis, fills and gradients with
+  # the area
+  return ops * scale + pixels * scale * scale * PIXEL_COST
+
+
+@functools.lru_cache(maxsize=1)
+def frame_ops():
+  # strokes and fills each save frame's compiled plan replays, counted
+  # from the plans themselves so the figures follow the drawing code
+  import spell_cards
+  writer = spell_cards.SigilWriter(1, seed=0)
+  return {save: sum(step[0] != "source"
+                    for step in writer.plan("frame", save, writer.compile_frame)[1])
+          for save in writer.draw_type}
+
+
+def spell_cost(spell, scale=2):
+  frames = frame_ops()
+  ops = CARD_OPS + frames.get(spell.get("SAVE", ""), max(frames.values()))
+  ops += len(sigils.SCHOOL_SIGILS.get(spell.get("SCHOOL", ""), ()))
+  for key in ("TARGETSHAPE", "DAMAGEDICE"):
+    ops += len(sigils.SHAPE_SIGILS.get(spell.get(key) or "", ()))
+  ops += RUNE_OPS * sum(len(spell.get(key) or "") for key in INSCRIBED)
+  return ops_cost(ops, CARD_PIXELS, scale)
+
+
+def text_cost(path, scale=1):
+  # a byte of text is about one rune and one cell of canvas
+  try:
+    runes = os.path.getsize(path)
+  except OSError:
+    runes = 0
+  return ops_cost(RUNE_OPS * runes, CELL_PIXELS * runes, scale)
+
+
+def longest_first(jobs, cost):
+  # (cost, index, job) from dearest to cheapest; ties keep their order
+  costed = [(cost(job), i, job) for i, job in enumerate(jobs)]
+  costed.sort(key=lambda item: (-item[0], item[1]))
+  return costed
+
+
+def in_order(jobs, run, cost, workers=1, window=None):
+  # jobs may be a generator; at most window jobs wait to be scheduled and
+  # window more are queued, running or held back until the jobs before
+  # them are done. Each job is reported as (job, error) in the order jobs
+  # gave it. With several workers the dearest waiting job is submitted
+  # next, so long jobs do not end up last on one worker while the others
+  # sit idle.
+  window = window or 2 * workers
+  waiting = []
+  submitted = {}
+  reported = 0
+  with ThreadPoolExecutor(max_workers=workers) as pool:
+    def submit(item):
+      _, index, job = item
+      submitted[index] = (job, pool.submit(run, job))
+
+    def next_finished():
+      # the next job to report may still be waiting behind dearer ones,
+      # in which case it is submitted now
+      nonlocal reported
+      if reported not in submitted:
+        item = next(item for item in waiting if item[1] == reported)
+        waiting.remove(item)
+        heapq.heapify(waiting)
+        submit(item)
+      job, future = submitted.pop(reported)
+      reported += 1
+      try:
+        future.result()
+        return job, None
+      except Exception as e:
+        return job, e
+
+    for index, job in enumerate(jobs):
+      estimate = cost(job) if workers > 1 else 0
+      heapq.heappush(waiting, (-estimate, index, job))
+      if len(waiting) >= window:
+        submit(heapq.heappop(waiting))
+      if len(submitted) >= window:
+        yield next_finished()
+    while waiting:
+      submit(heapq.heappop(waiting))
+      if len(submitted) >= window:
+        yield next_finished()
+    while submitted:
+      yield next_finished()
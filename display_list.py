@@ -0,0 +1,648 @@
+#!/usr/bin/env python
+
+from collections import namedtuple
+import functools
+import json
+import math
+
+# Typed drawing operations in the list's own device space. Every sub path
+# starts with a MoveTo, so the paths of several strokes can be joined
+# without picking up connecting lines.
+MoveTo = namedtuple("MoveTo", ["x", "y"])
+LineTo = namedtuple("LineTo", ["x", "y"])
+CurveTo = namedtuple("CurveTo", ["x1", "y1", "x2", "y2", "x3", "y3"])
+# an axis aligned elliptical arc around (x, y) with radii rx and ry,
+# swept from angle_1 to angle_2 as cairo's arc() would
+Arc = namedtuple("Arc", ["x", "y", "rx", "ry", "angle_1", "angle_2",
+                         "negative"])
+ClosePath = namedtuple("ClosePath", [])
+# ("solid", r, g, b, a), ("linear", x0, y0, x1, y1, stops) or
+# ("radial", x0, y0, r0, x1, y1, r1, stops), stops being
+# ((offset, r, g, b, a), ...)
+SetSource = namedtuple("SetSource", ["source"])
+# the pen is width_x by width_y; they differ for strokes made through a
+# non-uniform scale
+Stroke = namedtuple("Stroke", ["width_x", "width_y", "cap", "join"])
+Fill = namedtuple("Fill", [])
+
+OPS = {op.__name__: op for op in (MoveTo, LineTo, CurveTo, Arc, ClosePath,
+                                  SetSource, Stroke, Fill)}
+# cairo's LINE_CAP_* and LINE_JOIN_* values, in order
+CAPS = ("butt", "round", "square")
+JOINS = ("miter", "round", "bevel")
+# file names the writers record a display list for
+EXTENSIONS = (".svg", ".json")
+# lines this close to straight are merged by optimize()
+COLLINEAR = 1e-9
+# device distance under which two points are taken to be the same
+SAME_POINT = 1e-6
+
+
+# Affine matrix laid out as cairo's: x' = xx*x + xy*y + x0,
+# y' = yx*x + yy*y + y0
+class Matrix(namedtuple("Matrix", ["xx", "yx", "xy", "yy", "x0", "y0"])):
+  __slots__ = ()
+
+  def transform_point(self, x, y):
+    return (self.xx * x + self.xy * y + self.x0,
+            self.yx * x + self.yy * y + self.y0)
+
+  def transform_distance(self, dx, dy):
+    return self.xx * dx + self.xy * dy, self.yx * dx + self.yy * dy
+
+  def translated(self, tx, ty):
+    return self._replace(x0=self.xx * tx + self.xy * ty + self.x0,
+                         y0=self.yx * tx + self.yy * ty + self.y0)
+
+  def scaled(self, sx, sy):
+    return self._replace(xx=self.xx * sx, yx=self.yx * sx,
+                         xy=self.xy * sy, yy=self.yy * sy)
+
+  def multiply(self, other):
+    # this matrix followed by other, as cairo.Matrix.multiply
+    return Matrix(self.xx * other.xx + self.yx * other.xy,
+                  self.xx * other.yx + self.yx * other.yy,
+                  self.xy * other.xx + self.yy * other.xy,
+                  self.xy * other.yx + self.yy * other.yy,
+                  self.x0 * other.xx + self.y0 * other.xy + other.x0,
+                  self.x0 * other.yx + self.y0 * other.yy + other.y0)
+
+  def inverted(self):
+    det = self.xx * self.yy - self.xy * self.yx
+    xx, yx, xy, yy = self.yy / det, -self.yx / det, -self.xy / det, self.xx / det
+    return Matrix(xx, yx, xy, yy, -(xx * self.x0 + xy * self.y0),
+                  -(yx * self.x0 + yy * self.y0))
+
+
+IDENTITY = Matrix(1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+# Stands in for a cairo context and records what the writers draw as a
+# list of operations. Sources are only recorded when they change, and a
+# path that is never stroked or filled leaves nothing behind.
+class DisplayList:
+  def __init__(self, width, height, background=None, ops=None):
+    self.width = width
+    self.height = height
+    self.background = background
+    self.ops = list(ops or [])
+    self.matrix = IDENTITY
+    self.source = ("solid", 0.0, 0.0, 0.0, 1.0)
+    self.line_width = 2.0
+    self.cap = CAPS[0]
+    self.join = JOINS[0]
+    self.states = []
+    self.drawn_source = None
+    self.path = []
+    self.current = None
+    self.start = None
+
+  # state
+  def save(self):
+    self.states.append((self.matrix, self.source, self.line_width, self.cap,
+                        self.join))
+
+  def restore(self):
+    (self.matrix, self.source, self.line_width, self.cap,
+     self.join) = self.states.pop()
+
+  def get_matrix(self):
+    return self.matrix
+
+  def set_matrix(self, matrix):
+    self.matrix = Matrix(*matrix)
+
+  def identity_matrix(self):
+    self.matrix = IDENTITY
+
+  def translate(self, tx, ty):
+    self.matrix = self.matrix.translated(tx, ty)
+
+  def scale(self, sx, sy):
+    self.matrix = self.matrix.scaled(sx, sy)
+
+  def user_to_device_distance(self, dx, dy):
+    return self.matrix.transform_distance(dx, dy)
+
+  def get_line_width(self):
+    return self.line_width
+
+  def set_line_width(self, width):
+    self.line_width = width
+
+  def set_line_cap(self, cap):
+    self.cap = CAPS[int(cap)]
+
+  def set_line_join(self, join):
+    self.join = JOINS[int(join)]
+
+  def set_antialias(self, antialias):
+    pass
+
+  def set_source_rgb(self, r, g, b):
+    self.source = ("solid", r, g, b, 1.0)
+
+  def set_source(self, pattern):
+    self.source = describe_source(pattern, self.matrix)
+
+  # paths
+  def has_current_point(self):
+    return self.current is not None
+
+  def get_current_point(self):
+    if self.current is None:
+      return 0.0, 0.0
+    return self.matrix.inverted().transform_point(*self.current)
+
+  def new_path(self):
+    self.path = []
+    self.current = self.start = None
+
+  def new_sub_path(self):
+    self.current = None
+
+  def move_to(self, x, y):
+    self.current = self.start = self.matrix.transform_point(x, y)
+    self.path.append(MoveTo(*self.current))
+
+  def line_to(self, x, y):
+    if self.current is None:
+      self.move_to(x, y)
+      return
+    self.current = self.matrix.transform_point(x, y)
+    self.path.append(LineTo(*self.current))
+
+  def rel_move_to(self, dx, dy):
+    x, y = self.relative(dx, dy)
+    self.move_to(x, y)
+
+  def rel_line_to(self, dx, dy):
+    x, y = self.relative(dx, dy)
+    self.line_to(x, y)
+
+  def relative(self, dx, dy):
+    if self.current is None:
+      raise ValueError("relative move without a current point")
+    x, y = self.get_current_point()
+    return x + dx, y + dy
+
+  def curve_to(self, x1, y1, x2, y2, x3, y3):
+    if self.current is None:
+      self.move_to(x1, y1)
+    points = (self.matrix.transform_point(x1, y1) +
+              self.matrix.transform_point(x2, y2) +
+              self.matrix.transform_point(x3, y3))
+    self.path.append(CurveTo(*points))
+    self.current = points[4:]
+
+  def arc(self, xc, yc, radius, angle_1, angle_2):
+    while angle_2 < angle_1:
+      angle_2 += 2 * math.pi
+    self.add_arc(xc, yc, radius, angle_1, angle_2, False)
+
+  def arc_negative(self, xc, yc, radius, angle_1, angle_2):
+    while angle_2 > angle_1:
+      angle_2 -= 2 * math.pi
+    self.add_arc(xc, yc, radius, angle_1, angle_2, True)
+
+  def add_arc(self, xc, yc, radius, angle_1, angle_2, negative):
+    if self.matrix.xy or self.matrix.yx:
+      raise ValueError("display lists only hold arcs drawn axis aligned")
+    # cairo joins the current point to the arc's start; a join of no
+    # length is left out
+    start_x, start_y = xc + radius * math.cos(angle_1), yc + radius * math.sin(angle_1)
+    if (self.current is None or
+        math.dist(self.current, self.matrix.transform_point(start_x, start_y)) >= SAME_POINT):
+      self.line_to(start_x, start_y)
+    x, y = self.matrix.transform_point(xc, yc)
+    arc = Arc(x, y, radius * self.matrix.xx, radius * self.matrix.yy, angle_1,
+              angle_2, negative)
+    self.path.append(arc)
+    self.current = arc_end(arc)
+
+  def rectangle(self, x, y, width, height):
+    self.move_to(x, y)
+    self.line_to(x + width, y)
+    self.line_to(x + width, y + height)
+    self.line_to(x, y + height)
+    self.close_path()
+
+  def close_path(self):
+    if self.path:
+      self.path.append(ClosePath())
+      self.current = self.start
+
+  def append_path(self, path):
+    # cairo Path elements: move, line, curve and close are 0 to 3
+    for kind, points in path:
+      if kind == 0:
+        self.move_to(*points)
+      elif kind == 1:
+        self.line_to(*points)
+      elif kind == 2:
+        self.curve_to(*points)
+      else:
+        self.close_path()
+
+  # painting
+  def stroke(self):
+    width_x = self.line_width * math.hypot(self.matrix.xx, self.matrix.yx)
+    width_y = self.line_width * math.hypot(self.matrix.xy, self.matrix.yy)
+    self.draw(Stroke(width_x, width_y, self.cap, self.join))
+
+  def fill(self):
+    self.draw(Fill())
+
+  def draw(self, op):
+    if self.path:
+      if self.source != self.drawn_source:
+        self.ops.append(SetSource(self.source))
+        self.drawn_source = self.source
+      self.ops.extend(self.path)
+      self.ops.append(op)
+    self.new_path()
+
+  # output
+  def optimized(self):
+    return DisplayList(self.width, self.height, self.background,
+                       optimize(self.ops))
+
+  def replay(self, ctx):
+    replay(self.ops, ctx)
+
+  def to_surface(self, scale=1):
+    import cairo
+    import surfaces
+    surface = surfaces.new_filled_surface(int(self.width * scale),
+                                          int(self.height * scale),
+                                          self.background or (0, 0, 0))
+    ctx = cairo.Context(surface)
+    ctx.scale(scale, scale)
+    self.replay(ctx)
+    return surface
+
+  def to_json(self):
+    return {"width": self.width, "height": self.height,
+            "background": self.background,
+            "ops": [[type(op).__name__] + list(op) for op in self.ops]}
+
+  @classmethod
+  def from_json(cls, data):
+    ops = [OPS[op[0]](*frozen(op[1:])) for op in data["ops"]]
+    background = data.get("background")
+    return cls(data["width"], data["height"],
+               tuple(background) if background else None, ops)
+
+  def save_json(self, filename):
+    with open(filename, "w") as out:
+      json.dump(self.to_json(), out, separators=(",", ":"))
+
+  @classmethod
+  def load(cls, filename):
+    with open(filename) as infile:
+      return cls.from_json(json.load(infile))
+
+  def to_svg(self):
+    return svg(self.ops, self.width, self.height, self.background)
+
+  def write_svg(self, filename):
+    with open(filename, "w") as out:
+      out.write(self.to_svg())
+
+  def export(self, filename, palette=None):
+    # .svg and .json keep the vectors; anything else is rasterized to a
+    # png, indexed when given a palette
+    if filename.endswith(".svg"):
+      self.write_svg(filename)
+    elif filename.endswith(".json"):
+      self.save_json(filename)
+    elif palette is not None:
+      import png_writer
+      png_writer.write_indexed_png(self.to_surface(), filename, palette)
+    else:
+      self.to_surface().write_to_png(filename)
+
+
+def frozen(value):
+  # json gives lists back where the ops held tuples
+  if isinstance(value, list):
+    return tuple(frozen(item) for item in value)
+  return value
+
+
+def describe_source(pattern, matrix):
+  # patterns are placed in the user space of the set_source call, so their
+  # geometry is taken to device space here
+  stops = tuple(tuple(stop) for stop in getattr(pattern, "get_color_stops_rgba", list)())
+  if hasattr(pattern, "get_linear_points"):
+    x0, y0, x1, y1 = pattern.get_linear_points()
+    return (("linear",) + matrix.transform_point(x0, y0) +
+            matrix.transform_point(x1, y1) + (stops,))
+  if hasattr(pattern, "get_radial_circles"):
+    x0, y0, r0, x1, y1, r1 = pattern.get_radial_circles()
+    scale = math.sqrt(abs(matrix.xx * matrix.yy - matrix.xy * matrix.yx))
+    return (("radial",) + matrix.transform_point(x0, y0) + (r0 * scale,) +
+            matrix.transform_point(x1, y1) + (r1 * scale, stops))
+  if hasattr(pattern, "get_rgba"):
+    return ("solid",) + tuple(pattern.get_rgba())
+  raise ValueError("display lists hold solid and gradient sources only")
+
+
+def arc_point(arc, angle):
+  return arc.x + arc.rx * math.cos(angle), arc.y + arc.ry * math.sin(angle)
+
+
+def arc_end(arc):
+  return arc_point(arc, arc.angle_2)
+
+
+def end_point(op):
+  if isinstance(op, (MoveTo, LineTo)):
+    return op.x, op.y
+  if isinstance(op, CurveTo):
+    return op.x3, op.y3
+  if isinstance(op, Arc):
+    return arc_end(op)
+  return None
+
+
+def collinear(start, middle, end):
+  # true when middle lies on the way from start to end, so the two lines
+  # draw as one
+  if start is None:
+    return False
+  ax, ay = middle[0] - start[0], middle[1] - start[1]
+  bx, by = end[0] - middle[0], end[1] - middle[1]
+  cross = ax * by - ay * bx
+  return (ax * bx + ay * by > 0 and
+          abs(cross) <= COLLINEAR * math.hypot(ax, ay) * math.hypot(bx, by))
+
+
+def simplify(path, dots=False):
+  # drops moves that are moved on from or left at the end and lines that
+  # go nowhere, and merges runs of collinear lines, as the polygon styles
+  # draw along their outlines. With dots, a sub path that is nothing but a
+  # line of no length keeps it, since round caps draw it as a dot.
+  kept = []
+  dot = None
+  current = start = None
+  for op in path:
+    if isinstance(op, MoveTo):
+      if dot is not None:
+        kept.append(dot)
+        dot = None
+      current = start = op
+      if kept and isinstance(kept[-1], MoveTo):
+        kept[-1] = op
+      else:
+        kept.append(op)
+      continue
+    if (isinstance(op, LineTo) and current is not None and
+        math.dist(current, op) < SAME_POINT):
+      if dots and isinstance(kept[-1], MoveTo):
+        dot = op
+      continue
+    dot = None
+    if (isinstance(op, LineTo) and len(kept) >= 2 and
+        isinstance(kept[-1], LineTo) and
+        collinear(end_point(kept[-2]), end_point(kept[-1]), end_point(op))):
+      kept[-1] = op
+    else:
+      kept.append(op)
+    current = start if isinstance(op, ClosePath) else end_point(op)
+  if dot is not None:
+    kept.append(dot)
+  if kept and isinstance(kept[-1], MoveTo):
+    kept.pop()
+  return kept
+
+
+def optimize(ops):
+  # simplifies every path, drops sources that are already set or never
+  # drawn with and joins strokes with the same pen that follow each other
+  # into one
+  out = []
+  path = []
+  source = drawn = None
+  for op in ops:
+    if isinstance(op, SetSource):
+      source = op.source
+    elif isinstance(op, (Stroke, Fill)):
+      path = simplify(path, isinstance(op, Stroke) and op.cap != "butt")
+      if path:
+        if source != drawn:
+          out.append(SetSource(source))
+          drawn = source
+        elif (isinstance(op, Stroke) and out and type(out[-1]) is Stroke and
+              out[-1] == op):
+          out.pop()
+        out.extend(path)
+        out.append(op)
+      path = []
+    else:
+      path.append(op)
+  return out
+
+
+@functools.lru_cache(maxsize=64)
+def pattern(source):
+  import cairo
+  kind = source[0]
+  if kind == "solid":
+    return cairo.SolidPattern(*source[1:])
+  if kind == "linear":
+    pat = cairo.LinearGradient(*source[1:5])
+  else:
+    pat = cairo.RadialGradient(*source[1:7])
+  for stop in source[-1]:
+    pat.add_color_stop_rgba(*stop)
+  return pat
+
+
+def replay(ops, ctx):
+  # draws in ctx's current user space, which stands for the list's device
+  # space; scale ctx first for a larger image
+  ctx.save()
+  ctx.new_path()
+  previous = None
+  for op in ops:
+    kind = type(op)
+    if kind is MoveTo:
+      ctx.move_to(op.x, op.y)
+    elif kind is LineTo:
+      ctx.line_to(op.x, op.y)
+    elif kind is CurveTo:
+      ctx.curve_to(*op)
+    elif kind is Arc:
+      if op.rx and op.ry:
+        # an arc that starts its sub path leaves the move to cairo, which
+        # would otherwise add a line of no length to the arc's start
+        if (type(previous) is MoveTo and
+            math.dist(previous, arc_point(op, op.angle_1)) < SAME_POINT):
+          ctx.new_sub_path()
+        matrix = ctx.get_matrix()
+        ctx.translate(op.x, op.y)
+        ctx.scale(op.rx, op.ry)
+        if op.negative:
+          ctx.arc_negative(0, 0, 1, op.angle_1, op.angle_2)
+        else:
+          ctx.arc(0, 0, 1, op.angle_1, op.angle_2)
+        ctx.set_matrix(matrix)
+      else:
+        ctx.line_to(*arc_end(op))
+    elif kind is ClosePath:
+      ctx.close_path()
+    elif kind is SetSource:
+      ctx.set_source(pattern(op.source))
+    elif kind is Stroke:
+      ctx.set_line_cap(CAPS.index(op.cap))
+      ctx.set_line_join(JOINS.index(op.join))
+      if op.width_x == op.width_y:
+        ctx.set_line_width(op.width_x)
+        ctx.stroke()
+      else:
+        matrix = ctx.get_matrix()
+        ctx.scale(op.width_x, op.width_y)
+        ctx.set_line_width(1)
+        ctx.stroke()
+        ctx.set_matrix(matrix)
+    else:
+      ctx.fill()
+    previous = op
+  ctx.restore()
+
+
+def number(value, places=3):
+  text = "%.*f" % (places, value)
+  text = text.rstrip("0").rstrip(".")
+  return "0" if text == "-0" else text
+
+
+def svg_arc(arc, places=3):
+  # svg arcs run between end points, so sweeps are split into pieces of at
+  # most half a turn
+  sweep = arc.angle_2 - arc.angle_1
+  pieces = max(1, math.ceil(abs(sweep) / math.pi - 1e-9))
+  flag = int(not arc.negative) ^ int(arc.rx * arc.ry < 0)
+  parts = []
+  for i in range(1, pieces + 1):
+    x, y = arc_point(arc, arc.angle_1 + sweep * i / pieces)
+    parts.append("A%s %s 0 0 %d %s %s" % (
+      number(abs(arc.rx), places), number(abs(arc.ry), places), flag,
+      number(x, places), number(y, places)))
+  return " ".join(parts)
+
+
+def scaled(op, sx, sy):
+  if isinstance(op, (MoveTo, LineTo)):
+    return op._replace(x=op.x * sx, y=op.y * sy)
+  if isinstance(op, CurveTo):
+    return CurveTo(*(v * (sx, sy)[i % 2] for i, v in enumerate(op)))
+  if isinstance(op, Arc):
+    return op._replace(x=op.x * sx, y=op.y * sy, rx=op.rx * sx, ry=op.ry * sy)
+  return op
+
+
+def svg_path(path, places=3):
+  parts = []
+  for op in path:
+    kind = type(op)
+    if kind is MoveTo:
+      parts.append("M%s %s" % (number(op.x, places), number(op.y, places)))
+    elif kind is LineTo:
+      parts.append("L%s %s" % (number(op.x, places), number(op.y, places)))
+    elif kind is CurveTo:
+      parts.append("C" + " ".join(number(v, places) for v in op))
+    elif kind is Arc:
+      if op.rx and op.ry:
+        parts.append(svg_arc(op, places))
+      else:
+        parts.append("L%s %s" % tuple(number(v, places) for v in arc_end(op)))
+    else:
+      parts.append("Z")
+  return " ".join(parts)
+
+
+def svg_colour(r, g, b):
+  return "rgb(%d,%d,%d)" % tuple(round(c * 255) for c in (r, g, b))
+
+
+def svg_paint(source, gradients, pen=None):
+  # returns the paint and opacity for a source; gradients maps each one
+  # to its id and defs markup. svg wants stops in order, where cairo sorts
+  # them itself. A gradient used inside a pen's scale is scaled back, so
+  # it still lands where cairo put it.
+  if source[0] == "solid":
+    return svg_colour(*source[1:4]), source[4]
+  key = source, pen
+  if key not in gradients:
+    name = "g%d" % len(gradients)
+    stops = "".join('<stop offset="%s" stop-color="%s" stop-opacity="%s"/>' % (
+      number(offset), svg_colour(r, g, b), number(a))
+      for offset, r, g, b, a in sorted(source[-1], key=lambda stop: stop[0]))
+    transform = ""
+    if pen is not None:
+      transform = ' gradientTransform="scale(%s %s)"' % (
+        number(1 / pen[0], 6), number(1 / pen[1], 6))
+    if source[0] == "linear":
+      x1, y1, x2, y2 = (number(v) for v in source[1:5])
+      markup = ('<linearGradient id="%s" gradientUnits="userSpaceOnUse"%s '
+                           'x1="%s" y1="%s" x2="%s" y2="%s">%s</linearGradient>' % (
+                             name, transform, x1, y1, x2, y2, stops))
+    else:
+      fx, fy, fr, cx, cy, r = (number(v) for v in source[1:7])
+      markup = ('<radialGradient id="%s" gradientUnits="userSpaceOnUse"%s '
+                           'fx="%s" fy="%s" fr="%s" cx="%s" cy="%s" r="%s">'
+                           '%s</radialGradient>' % (name, transform, fx, fy, fr,
+                                                    cx, cy, r, stops))
+    gradients[key] = name, markup
+  return "url(#%s)" % gradients[key][0], 1.0
+
+
+def svg(ops, width, height, background=None):
+  gradients = {}
+  shapes = []
+  source = ("solid", 0.0, 0.0, 0.0, 1.0)
+  paint, opacity = svg_paint(source, gradients)
+  path = []
+  for op in ops:
+    if isinstance(op, SetSource):
+      source = op.source
+      paint, opacity = svg_paint(source, gradients)
+    elif isinstance(op, Stroke):
+      # svg pens are round, so an elliptical one is drawn as a pen of one
+      # unit inside its own scale, as replay() does with cairo. cairo's
+      # miter limit is 10 where svg's is 4.
+      style = ('fill="none" stroke="%%s" stroke-opacity="%s" '
+               'stroke-linecap="%s" stroke-linejoin="%s" '
+               'stroke-miterlimit="10"' % (number(opacity), op.cap, op.join))
+      if op.width_x == op.width_y or not op.width_x * op.width_y:
+        shapes.append('<path d="%s" %s stroke-width="%s"/>' % (
+          svg_path(path), style % paint, number(math.sqrt(op.width_x * op.width_y))))
+      else:
+        pen = op.width_x, op.width_y
+        pen_path = [scaled(path_op, 1 / op.width_x, 1 / op.width_y)
+                    for path_op in path]
+        shapes.append('<g transform="scale(%s %s)"><path d="%s" %s '
+                      'stroke-width="1"/></g>' % (
+                        number(op.width_x, 6), number(op.width_y, 6),
+                        svg_path(pen_path, 6),
+                        style % svg_paint(source, gradients, pen)[0]))
+      path = []
+    elif isinstance(op, Fill):
+      shapes.append('<path d="%s" fill="%s" fill-opacity="%s"/>' % (
+        svg_path(path), paint, number(opacity)))
+      path = []
+    else:
+      path.append(op)
+  lines = ['<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" '
+           'viewBox="0 0 %d %d">' % (width, height, width, height)]
+  if gradients:
+    lines.append("<defs>" + "".join(markup for name, markup in
+                                    gradients.values()) + "</defs>")
+  if background is not None:
+    lines.append('<rect width="100%%" height="100%%" fill="%s"/>' %
+                 svg_colour(*background))
+  lines.extend(shapes)
+  lines.append("</svg>")
+  return "\n".join(lines) + "\n"
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import cairo
+import character_writer as CW
+import spell_cards
+import spells
+import text_layout
+
+SEED = 0
+# hashes.json entry recording the RENDERER_VERSION the goldens were drawn by
+VERSION_KEY = "renderer_version"
+RED = (0xffff0000).to_bytes(4, sys.byteorder)
+
+
+def spl_cases(indir="src"):
+  for filename in sorted(os.listdir(indir)):
+    if filename.endswith(".spl"):
+      path = os.path.join(indir, filename)
+      yield "spl_" + filename.split(".")[0], lambda path=path: draw_card(spells.read_spl(path))
+
+
+def csv_cases(csv_path="All_Spells.csv", sample=20):
+  # the first valid rows keep the sample stable as the catalogue grows
+  count = 0
+  for spell in spells.open_csv(csv_path)[1]:
+    if count >= sample:
+      break
+    if not spell.errors:
+      count += 1
+      yield "csv_" + spell["NAME"], lambda spell=spell: draw_card(spell)
+
+
+def text_cases(infile="input.txt"):
+  for style in CW.CharacterWriter.STYLES:
+    yield "text_" + style, lambda style=style: draw_text(infile, style)
+
+
+def corpus(sample=20):
+  yield from spl_cases()
+  yield from csv_cases(sample=sample)
+  yield from text_cases()
+
+
+def draw_card(spell):
+  scribe = spell_cards.SigilWriter(2, seed=SEED)
+  scribe.draw_spell_from_dict(spell)
+  return scribe.surface
+
+
+def draw_text(infile, style):
+  cw = CW.CharacterWriter(1)
+  cw.style = cw.STYLES[style]
+  page = text_layout.layout(cw, cw.parse_file(infile)[2])[0]
+  cw.generate_default_context(page.columns, page.rows)
+  cw.write_glyphs(page.glyphs)
+  return cw.surface
+
+
+def file_name(case):
+  return "".join(c if c.isalnum() or c in "-_" else "_" for c in case) + ".png"
+
+
+def pixel_rows(surface):
+  surface.flush()
+  data = surface.get_data()
+  stride, width = surface.get_stride(), surface.get_width() * 4
+  return [bytes(data[y * stride:y * stride + width])
+          for y in range(surface.get_height())]
+
+
+def pixel_hash(surface):
+  digest = hashlib.sha256()
+  digest.update(b"%dx%d" % (surface.get_width(), surface.get_height()))
+  for row in pixel_rows(surface):
+    digest.update(row)
+  return digest.hexdigest()
+
+
+def compare(surface, golden, tolerance):
+  # returns the number of pixels with a channel further than tolerance
+  # from the golden image, and the diff image marking them
+  width, height = surface.get_width(), surface.get_height()
+  if (width, height) != (golden.get_width(), golden.get_height()):
+    return width * height, None
+  diff = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+  out = diff.get_data()
+  stride = diff.get_stride()
+  bad = 0
+  for y, (row, gold) in enumerate(zip(pixel_rows(surface), pixel_rows(golden))):
+    base = y * stride
+    for x in range(0, len(row), 4):
+      pixel = row[x:x + 4]
+      expected = gold[x:x + 4]
+      if pixel != expected and max(abs(a - b) for a, b in zip(pixel, expected)) > tolerance:
+        bad += 1
+        out[base + x:base + x + 4] = RED
+      else:
+        grey = sum(expected[:3]) // 12
+        out[base + x:base + x + 4] = (0xff000000 | grey * 0x10101).to_bytes(4, sys.byteorder)
+  diff.mark_dirty()
+  return bad, diff
+
+
+class StaleRenderer(Exception):
+  pass
+
+
+def load_hashes(golden_dir):
+  with open(os.path.join(golden_dir, "hashes.json")) as infile:
+    hashes = json.load(infile)
+  return hashes.pop(VERSION_KEY, None), hashes
+
+
+def update(golden_dir="golden", sample=20):
+  # goldens only move with spell_cards.RENDERER_VERSION: changed pixels
+  # under the version they were blessed with would leave stores serving
+  # cards drawn by the old code, so they are refused until it is bumped
+  try:
+    version, old = load_hashes(golden_dir)
+  except FileNotFoundError:
+    version, old = None, {}
+  rendered = [(case, draw()) for case, draw in corpus(sample)]
+  hashes = {case: pixel_hash(surface) for case, surface in rendered}
+  changed = sorted(case for case in hashes
+                   if case in old and old[case] != hashes[case])
+  if changed and version == spell_cards.RENDERER_VERSION:
+    raise StaleRenderer("pixels changed for %s; bump spell_cards.RENDERER_VERSION"
+                        % ", ".join(changed))
+  os.makedirs(golden_dir, exist_ok=True)
+  for case, surface in rendered:
+    surface.write_to_png(os.path.join(golden_dir, file_name(case)))
+  with open(os.path.join(golden_dir, "hashes.json"), "w") as out:
+    json.dump(dict(hashes, **{VERSION_KEY: spell_cards.RENDERER_VERSION}), out,
+              indent=2, sort_keys=True)
+  return hashes
+
+
+def check(golden_dir="golden", diff_dir="out/golden_diff", sample=20,
+          tolerance=None, max_fraction=0.0):
+  # exact mode passes only on matching pixel hashes; with a tolerance a
+  # case passes while the share of pixels off by more than it stays
+  # within max_fraction
+  hashes = load_hashes(golden_dir)[1]
+  results = {}
+  for case, draw in corpus(sample):
+    if case not in hashes:
+      results[case] = "missing golden"
+      continue
+    surface = draw()
+    if pixel_hash(surface) == hashes[case]:
+      results[case] = "ok"
+      continue
+    golden = cairo.ImageSurface.create_from_png(os.path.join(golden_dir, file_name(case)))
+    bad, diff = compare(surface, golden, tolerance or 0)
+    fraction = bad / max(surface.get_width() * surface.get_height(), 1)
+    if tolerance is not None and fraction <= max_fraction:
+      results[case] = "ok"
+    else:
+      results[case] = "changed"
+    if results[case] != "ok" and diff is not None:
+      os.makedirs(diff_dir, exist_ok=True)
+      diff.write_to_png(os.path.join(diff_dir, file_name(case)))
+  return results
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Golden image regression check")
+  parser.add_argument("command", choices=["check", "update"])
+  parser.add_argument("--golden", default="golden")
+  parser.add_argument("--diff", default="out/golden_diff")
+  parser.add_argument("--sample", type=int, default=20, help="csv rows to render")
+  parser.add_argument("--tolerance", type=int,
+                      help="allowed per channel difference, 0-255")
+  parser.add_argument("--max-fraction", type=float, default=0.0,
+                      help="share of pixels allowed past the tolerance")
+  args = parser.parse_args(argv)
+
+  if args.command == "update":
+    try:
+      hashes = update(args.golden, args.sample)
+    except StaleRenderer as error:
+      print(json.dumps({"error": str(error)}, indent=2))
+      return 1
+    print(json.dumps({"updated": len(hashes)}, indent=2))
+    return 0
+  results = check(args.golden, args.diff, args.sample, args.tolerance,
+                  args.max_fraction)
+  failed = sorted(case for case, result in results.items() if result != "ok")
+  print(json.dumps({"checked": len(results),
+                    "failed": {case: results[case] for case in failed}},
+                   indent=2))
+  return 1 if failed else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
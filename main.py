@@ -1,6 +1,16 @@
+import argparse
+import json
 import os
-import spell_cards
-from colored import fg, bg, attr
+import re
+import sys
+import catalogue
+import cost
+import spells
+import text_layout
+
+# spell_cards, character_writer, output_store, surfaces and watcher bring in
+# cairo, so they are imported by the commands that draw. Listing and
+# searching spells start without them.
 
 def clear():
   
@@ -32,32 +42,21 @@ class terminal_selection_menu:
         print("PLEASE INPUT AN INTEGER IN RANGE")
 
 def main():
-  with open("All_Spells.csv", "r") as infile:
-    lines = infile.readlines()
-
-  pos = 0
-  titles = lines[0]
-  spells = lines[1:]
-  header_to_index = {}
-  for title in titles.split(","):
-    header_to_index[title.strip()] = pos
-    pos += 1
-
-  print(spells[0])
-  spell_dict = {}
-  for header in header_to_index:
+  import spell_cards
+  headers, records = spells.open_csv("All_Spells.csv")
+  spell_dict = next(records)
+
+  print(spell_dict)
+  for header in headers:
     print(header, end=":")
-    print(spells[0].split(",")[header_to_index[header]].strip())
-    spell_dict[header] = spells[0].split(",")[header_to_index[header]].strip()
-  c = "C" if spell_dict["CONCENTRATION"] == "yes" else ""
-  r = "R" if spell_dict["RITUAL"] == "yes" else ""
-  spell_dict["C/R"] = c+r
+    print(spell_dict[header])
 
   scribe = spell_cards.SigilWriter(2)
   scribe.draw_spell_from_dict(spell_dict)
   scribe.export_image(spell_dict["NAME"] + ".png")
 
 def print_palette(dir):
+  from colored import bg, attr
   for filename in os.scandir(dir):
     if filename.is_file() and filename.name.endswith(".spl"):
       with open(filename.path, "r") as infile:
@@ -79,24 +78,21 @@ class spell_db_interface:
     self.load_db() 
 
   def load_db(self):
-    with open(self.csv_in, "r") as db:
-      lines = db.readlines()
-
+    headers, self.index = catalogue.compiled(self.csv_in)
+    self.spells = {spell["NAME"]: spell for spell in self.index.records}
     self.header_to_index = {}
-    header_titles = lines[0].split(",")
-    for i in range(len(header_titles)):
-      self.header_to_index[header_titles[i].strip()] = i
+    for i in range(len(headers)):
+      self.header_to_index[headers[i]] = i
     self.index_to_header = list(self.header_to_index.keys())
 
-    self.spells = {}
-    for spell_line in lines[1:]:
-      spell_dict = {}
-      for header in self.header_to_index:
-        spell_dict[header] = spell_line.split(",")[self.header_to_index[header]].strip()
-      c = "C" if spell_dict["CONCENTRATION"] == "yes" else ""
-      r = "R" if spell_dict["RITUAL"] == "yes" else ""
-      spell_dict["C/R"] = c+r
-      self.spells[spell_dict["NAME"]] = spell_dict 
+  def columns(self):
+    if self.index is None:
+      self.index = catalogue.Catalogue(self.spells.values())
+    return self.index
+
+  def query(self, *conditions, sort=(), reverse=False, **lookups):
+    return self.columns().query(*conditions, sort=sort, reverse=reverse,
+                                **lookups)
 
   def select_function(self):
     functions = ["Print Spell Card",
@@ -119,6 +115,7 @@ class spell_db_interface:
     prompt = "Current Value: " + self.spells[name][header] + "\n"
     prompt += "Please Enter New Value for " + header + " :"
     self.spells[name][header] = input(prompt).strip()
+    self.index = None
 
   def correct_malformed_spell(self, name):
     intro = "Spell \"" + name + "\" is missing information\n\
@@ -130,6 +127,7 @@ Please select field to update"
     input(message+"\n\nPress ENTER to continue")
 
   def draw_spell_card_with_valid_name(self, name):
+    import spell_cards
     try:
       scribe = spell_cards.SigilWriter(2)
       scribe.draw_spell_from_dict(self.spells[name])
@@ -169,7 +167,282 @@ Please select field to update"
           
 
 
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_NO_MATCH = 3
+
+
+FILTER_OPS = {"=": "eq", "!=": "ne", "<": "lt", "<=": "le", ">": "gt", ">=": "ge"}
+
+
+def filter_arg(text):
+  match = re.match(r"^\s*([\w/]+)\s*(<=|>=|!=|=|<|>)\s*(.*?)\s*$", text)
+  if not match:
+    raise argparse.ArgumentTypeError("expected KEY=VALUE or KEY<=NUMBER, got " + text)
+  key, op, value = match.groups()
+  if op not in ("=", "!=") and catalogue.to_number(value) is None:
+    raise argparse.ArgumentTypeError(key + op + " needs a number, got " + value)
+  return key.upper(), FILTER_OPS[op], value
+
+
+def load_catalogue(args):
+  if args.src:
+    found = {}
+    for filename in sorted(os.scandir(args.src), key=lambda f: f.name):
+      if filename.is_file() and filename.name.endswith(".spl"):
+        spell_dict = spells.read_spl(filename.path)
+        found[spell_dict["NAME"]] = spell_dict
+    return catalogue.Catalogue(found.values())
+  return catalogue.compiled(args.csv, args.cache)[1]
+
+
+def select_spells(index, names, filters, sort=()):
+  selected = index.query(*filters, sort=sort)
+  if names:
+    selected = [spell for spell in selected
+                if any(n.upper() in spell["NAME"].upper() for n in names)]
+  return selected
+
+
+def run_jobs(tasks, jobs, estimate=None):
+  # with an estimate the dearest tasks are submitted first; outputs keep
+  # the order of tasks
+  from concurrent.futures import ThreadPoolExecutor
+  outputs = []
+  failed = []
+  if estimate is None:
+    order = list(enumerate(tasks))
+  else:
+    order = [(i, task) for _, i, task in cost.longest_first(tasks, estimate)]
+  with ThreadPoolExecutor(max_workers=jobs) as pool:
+    futures = sorted((i, label, pool.submit(func, *func_args))
+                     for i, (label, func, func_args) in order)
+    for i, label, future in futures:
+      try:
+        outputs.append(future.result())
+      except Exception as e:
+        failed.append({"name": label, "error": str(e)})
+  return outputs, failed
+
+
+def stream_spells(args):
+  if args.src:
+    records = load_catalogue(args).records
+  else:
+    records = spells.open_csv(args.csv, args.mmap)[1]
+  for spell in records:
+    if args.names and not any(n.upper() in spell["NAME"].upper() for n in args.names):
+      continue
+    if catalogue.matches(spell, args.filter):
+      yield spell
+
+
+def cmd_render(args):
+  import output_store
+  import spell_cards
+  if args.stream:
+    selected = stream_spells(args)
+  else:
+    selected = select_spells(load_catalogue(args), args.names, args.filter,
+                             args.sort)
+  os.makedirs(args.out, exist_ok=True)
+  store = None
+  if not args.no_store:
+    store = output_store.OutputStore(args.store, args.store_budget * 1024 * 1024)
+  renders = ((spell, os.path.join(args.out, spells.file_stem(spell["NAME"]) +
+                                   "." + args.format))
+             for spell in selected)
+  outputs = []
+  failed = []
+  rendered = 0
+  for spell, filename, error in spell_cards.render_stream(renders, args.scale,
+                                                          args.jobs, store,
+                                                          indexed=args.indexed,
+                                                          draft=args.draft):
+    if error is not None:
+      failed.append({"name": spell["NAME"], "error": str(error)})
+    else:
+      rendered += 1
+      if not args.stream:
+        outputs.append(filename)
+  summary = {"outputs": outputs, "failed": failed, "rendered": rendered}
+  if not rendered and not failed:
+    summary["error"] = "no spells matched"
+  return summary
+
+
+def cmd_translate(args):
+  import character_writer
+  os.makedirs(args.out, exist_ok=True)
+  tasks = []
+  for infile in args.files:
+    stem = os.path.splitext(os.path.basename(infile))[0]
+    outfile = os.path.join(args.out, stem + "." + args.format)
+    tasks.append((infile, character_writer.translate_file,
+                  (infile, outfile, args.style, args.scale, args.columns,
+                   args.rows, args.align, args.indexed, args.draft)))
+  outputs, failed = run_jobs(tasks, args.jobs,
+                             lambda task: cost.text_cost(task[0], args.scale))
+  return {"outputs": outputs, "failed": failed}
+
+
+def cmd_palettes(args):
+  palettes = {}
+  for spell in load_catalogue(args).records:
+    if "PALETTE" in spell:
+      palettes[spell["NAME"]] = ["#" + color for color in spell["PALETTE"].split("#") if color]
+  os.makedirs(args.out, exist_ok=True)
+  outfile = os.path.join(args.out, "palettes.json")
+  with open(outfile, "w") as out:
+    json.dump(palettes, out, indent=2)
+  return {"outputs": [outfile], "failed": [], "palettes": palettes}
+
+
+def cmd_list(args):
+  selected = select_spells(load_catalogue(args), args.names, args.filter,
+                           args.sort)
+  summary = {"outputs": [], "failed": [],
+             "spells": [{"name": spell["NAME"],
+                         "level": spell.get("LEVEL", ""),
+                         "school": spell.get("SCHOOL", "")} for spell in selected]}
+  if not selected:
+    summary["error"] = "no spells matched"
+  return summary
+
+
+def cmd_watch(args):
+  import watcher
+  store = None
+  if args.store:
+    import output_store
+    store = output_store.OutputStore(args.store, args.store_budget * 1024 * 1024)
+  watch = watcher.Watcher(args.src, args.csv, args.out, args.scale, args.jobs,
+                          args.interval, args.debounce, args.draft, store)
+  try:
+    watch.run(initial=args.initial)
+  except KeyboardInterrupt:
+    pass
+  return {"outputs": [], "failed": []}
+
+
+def build_parser():
+  parser = argparse.ArgumentParser(description="Render spell cards and rune text")
+  commands = parser.add_subparsers(dest="command", required=True)
+
+  def add_source(sub):
+    sub.add_argument("--csv", default="All_Spells.csv")
+    sub.add_argument("--src", help="read .spl files from this directory instead of the csv")
+    sub.add_argument("--cache", default=catalogue.default_cache_dir(),
+                     help="directory of compiled catalogues; empty to parse the csv every time")
+
+  def add_draft(sub):
+    sub.add_argument("--draft", nargs="?", const="fast", default=False,
+                     choices=["fast", "none"],
+                     help="quick preview quality: half scale, solid colours "
+                          "and fast (or no) antialiasing")
+
+  def add_output(sub, formats, scale):
+    sub.add_argument("--out", default="out")
+    sub.add_argument("--indexed", action="store_true",
+                     help="write 8 bit palette PNGs")
+    sub.add_argument("--format", choices=formats, default=formats[0])
+    sub.add_argument("--scale", type=float, default=scale)
+    sub.add_argument("--jobs", type=int, default=1)
+    add_draft(sub)
+    sub.add_argument("--memory-budget", type=float, metavar="MB",
+                     help="refuse a card or page whose surfaces together exceed this")
+    sub.add_argument("--memory-warn", action="store_true",
+                     help="only warn when a render goes over the budget")
+    sub.add_argument("--memory-report", action="store_true",
+                     help="add process wide surface, tracemalloc and RSS figures to the summary")
+
+  render = commands.add_parser("render", help="draw spell cards")
+  render.add_argument("names", nargs="*", help="spell names or parts of names")
+  render.add_argument("--filter", type=filter_arg, action="append", default=[],
+                      metavar="KEY=VALUE")
+  render.add_argument("--sort", action="append", default=[], metavar="FIELD")
+  add_source(render)
+  add_output(render, ["png", "pdf", "svg", "json"], 2)
+  render.add_argument("--store", default=".render_store",
+                      help="directory of stored renders shared between runs")
+  render.add_argument("--store-budget", type=int, default=512, metavar="MB")
+  render.add_argument("--no-store", action="store_true")
+  render.add_argument("--stream", action="store_true",
+                      help="read and render the catalogue one spell at a time, "
+                           "in catalogue order; --csv - reads from stdin")
+  render.add_argument("--mmap", action="store_true",
+                      help="memory map the csv when streaming")
+  render.set_defaults(run=cmd_render)
+
+  translate = commands.add_parser("translate", help="write text files in runes")
+  translate.add_argument("files", nargs="+")
+  translate.add_argument("--style", choices=text_layout.STYLES,
+                         default="curved")
+  translate.add_argument("--columns", type=int)
+  translate.add_argument("--rows", type=int, default=40, help="rows per pdf page")
+  translate.add_argument("--align", choices=["left", "center", "right"], default="left")
+  add_output(translate, ["png", "pdf", "svg", "json"], 1)
+  translate.set_defaults(run=cmd_translate)
+
+  palettes = commands.add_parser("palettes", help="export spell palettes as json")
+  palettes.add_argument("--out", default="out")
+  add_source(palettes)
+  palettes.set_defaults(run=cmd_palettes)
+
+  listing = commands.add_parser("list", help="list spells")
+  listing.add_argument("names", nargs="*")
+  listing.add_argument("--filter", type=filter_arg, action="append", default=[],
+                       metavar="KEY=VALUE")
+  listing.add_argument("--sort", action="append", default=[], metavar="FIELD")
+  add_source(listing)
+  listing.set_defaults(run=cmd_list)
+  watch = commands.add_parser("watch", help="re-render cards as they are edited")
+  watch.add_argument("--src", default="src")
+  watch.add_argument("--csv", default="All_Spells.csv")
+  watch.add_argument("--out", default="out")
+  watch.add_argument("--scale", type=float, default=2)
+  watch.add_argument("--jobs", type=int, default=1)
+  add_draft(watch)
+  watch.add_argument("--interval", type=float, default=0.5)
+  watch.add_argument("--debounce", type=float, default=0.3)
+  watch.add_argument("--initial", action="store_true",
+                     help="render everything once before watching")
+  watch.add_argument("--store", metavar="DIR",
+                     help="take unchanged cards from this render store")
+  watch.add_argument("--store-budget", type=int, default=512, metavar="MB")
+  watch.set_defaults(run=cmd_watch)
+  return parser
+
+
+def cli(argv):
+  parser = build_parser()
+  args = parser.parse_args(argv)
+  # streamed spells are drawn as they are read, so there is nothing to sort
+  if getattr(args, "stream", False) and args.sort:
+    parser.error("--stream cannot be combined with --sort")
+  if getattr(args, "memory_budget", None) or getattr(args, "memory_report", False):
+    import surfaces
+  if getattr(args, "memory_budget", None):
+    surfaces.set_memory_budget(int(args.memory_budget * 1024 * 1024),
+                               refuse=not args.memory_warn)
+  if getattr(args, "memory_report", False):
+    with surfaces.MemoryTracker(args.command) as tracker:
+      summary = args.run(args)
+    summary["memory"] = tracker.report()
+  else:
+    summary = args.run(args)
+  summary["command"] = args.command
+  print(json.dumps(summary, indent=2))
+  if summary.get("error"):
+    return EXIT_NO_MATCH
+  if summary["failed"]:
+    return EXIT_FAILED
+  return EXIT_OK
+
+
 if __name__ == "__main__":
+  if len(sys.argv) > 1:
+    sys.exit(cli(sys.argv[1:]))
   options = ["Draw Acid Splash",
              "Print Color Palletes",
              "Test"]
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import spell_cards
+
+# fields draw_spell_from_dict reads; anything else in a record cannot
+# change the card
+RENDER_FIELDS = ("NAME", "LEVEL", "SCHOOL", "CASTINGTIME", "COMPONENTS",
+                 "DAMAGE", "DAMAGEDICE", "DURATION", "TARGET", "TARGETSHAPE",
+                 "SAVE", "RANGE", "PALETTE", "C/R")
+
+
+# Rendered cards stored under the sha256 of everything that goes into
+# drawing them. Requested filenames get a copy of the stored object, so
+# identical cards are drawn once. Objects are touched when used. The store
+# is walked once when opened; after that sizes and last uses are kept in
+# memory, and once the total grows past the budget in bytes the least
+# recently used objects are removed until it is back under LOW_WATER of
+# the budget.
+class OutputStore:
+  LOW_WATER = 0.9
+
+  def __init__(self, root=".render_store", budget=512 * 1024 * 1024):
+    self.root = root
+    self.budget = budget
+    self.lock = threading.Lock()
+    os.makedirs(self.root, exist_ok=True)
+    self.entries = {path: (size, used) for path, size, used in self.objects()}
+    self.size = sum(size for size, used in self.entries.values())
+
+  def key(self, spell, scale, seed, fmt, indexed=False, draft=False):
+    inputs = {"fields": [[field, spell.get(field)] for field in RENDER_FIELDS],
+              "scale": scale,
+              "seed": seed,
+              "format": fmt,
+              "indexed": indexed,
+              "version": spell_cards.RENDERER_VERSION}
+    if draft:
+      inputs["draft"] = draft
+    text = json.dumps(inputs, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+  def path(self, key, fmt):
+    return os.path.join(self.root, key[:2], key + "." + fmt)
+
+  def objects(self):
+    for dirpath, dirnames, filenames in os.walk(self.root):
+      for name in filenames:
+        if name.count(".") != 1:
+          continue
+        path = os.path.join(dirpath, name)
+        stat = os.stat(path)
+        yield path, stat.st_size, stat.st_mtime_ns
+
+  def render(self, spell, filename, scale=2, seed=None, indexed=False,
+             draft=False):
+    # an unseeded card is a random draw, so any stored draw of the same
+    # spell is as good as a new one
+    fmt = os.path.splitext(filename)[1].lstrip(".") or "png"
+    obj = self.path(self.key(spell, scale, seed, fmt, indexed, draft), fmt)
+    with self.lock:
+      if self.fetch(obj, filename):
+        return filename
+    os.makedirs(os.path.dirname(obj), exist_ok=True)
+    tmp = "%s.%d.%d.%s" % (obj[:-len(fmt) - 1], os.getpid(),
+                           threading.get_ident(), fmt)
+    spell_cards.render_spell(spell, tmp, scale, seed, indexed, draft)
+    self.copy(tmp, filename)
+    with self.lock:
+      os.replace(tmp, obj)
+      self.used(obj)
+    return filename
+
+  def fetch(self, obj, filename):
+    # called under the lock, so no other thread can evict the object
+    # between finding it and copying it out
+    try:
+      os.utime(obj)
+      self.copy(obj, filename)
+    except FileNotFoundError:
+      return False
+    self.used(obj)
+    return True
+
+  def used(self, obj):
+    # called under the lock; a card rendered by two threads at once, or by
+    # another process, is counted once, at its size on disk
+    stat = os.stat(obj)
+    size, _ = self.entries.get(obj, (0, 0))
+    self.entries[obj] = (stat.st_size, stat.st_mtime_ns)
+    self.size += stat.st_size - size
+    if self.size > self.budget:
+      self.evict(keep=obj)
+
+  def copy(self, obj, filename):
+    # outputs are copies, never links: writers that later open the output
+    # for writing would otherwise truncate the stored object with it. The
+    # old file is removed first in case it is a link left by an older store
+    if os.path.lexists(filename):
+      os.remove(filename)
+    shutil.copyfile(obj, filename)
+
+  def evict(self, keep=None):
+    # called under the lock
+    target = self.budget * self.LOW_WATER
+    for path in sorted(self.entries, key=lambda path: self.entries[path][1]):
+      if self.size <= target:
+        break
+      if path == keep:
+        continue
+      try:
+        os.remove(path)
+      except FileNotFoundError:
+        pass
+      self.size -= self.entries.pop(path)[0]
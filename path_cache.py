@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+import cairo
+
+
+# Stands in for a cairo.Context while drawing code is compiled. Paths are
+# built on a scratch context, and every stroke or fill is stored as user
+# space paths plus the matrix and pen width they were drawn with, so replay
+# hands cairo the same stroke it would have seen, instead of being
+# rasterized. Strokes following each other with the same matrix, pen and
+# source are batched into one step, so they are rasterized in one pass on
+# replay. A set_source call becomes a "source" step so the caller can pick
+# a fresh source when the steps are replayed.
+class PathRecorder:
+  def __init__(self):
+    self.scratch = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1))
+    self.steps = []
+    self.sources = [None]
+
+  def __getattr__(self, name):
+    return getattr(self.scratch, name)
+
+  def save(self):
+    self.sources.append(self.sources[-1])
+    self.scratch.save()
+
+  def restore(self):
+    self.sources.pop()
+    self.scratch.restore()
+
+  def set_source_rgb(self, r, g, b):
+    self.sources[-1] = (r, g, b)
+
+  def set_source(self, pattern):
+    self.sources[-1] = None
+    self.steps.append(("source", None, None, None, None))
+
+  def stroke(self):
+    self.emit("stroke")
+
+  def fill(self):
+    self.emit("fill")
+
+  def emit(self, op):
+    matrix = self.scratch.get_matrix()
+    width = self.scratch.get_line_width()
+    path = self.scratch.copy_path()
+    self.scratch.new_path()
+    if op == "stroke" and self.steps:
+      last_op, paths, last_matrix, last_width, rgb = self.steps[-1]
+      if (last_op == "stroke" and last_matrix == matrix and last_width == width
+          and rgb == self.sources[-1]):
+        self.steps[-1] = (op, paths + (path,), matrix, width, rgb)
+        return
+    self.steps.append((op, (path,), matrix, width, self.sources[-1]))
+
+
+def polyline_path(points):
+  scratch = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1))
+  scratch.move_to(*points[0])
+  for x, y in points[1:]:
+    scratch.line_to(x, y)
+  return scratch.copy_path()
+
+
+def replay(ctx, steps, use_source):
+  # steps were recorded from an identity matrix, which stands for the
+  # caller's user space, so each step's matrix is applied on top of the
+  # caller's. The caller's matrix is put back for use_source, whose
+  # patterns are placed in the caller's space, and a save/restore is only
+  # needed around steps with their own colour
+  matrix = ctx.get_matrix()
+  line_width = ctx.get_line_width()
+  for op, paths, step_matrix, width, rgb in steps:
+    if op == "source":
+      ctx.set_matrix(matrix)
+      use_source()
+      continue
+    if rgb is not None:
+      ctx.save()
+      ctx.set_source_rgb(*rgb)
+    ctx.set_matrix(type(matrix)(*step_matrix).multiply(matrix))
+    ctx.new_path()
+    for path in paths:
+      ctx.append_path(path)
+    if op == "fill":
+      ctx.fill()
+    else:
+      ctx.set_line_width(width)
+      ctx.stroke()
+    if rgb is not None:
+      ctx.restore()
+  ctx.set_matrix(matrix)
+  ctx.set_line_width(line_width)
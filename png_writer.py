@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+import functools
+import itertools
+import operator
+import struct
+import zlib
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def to_bytes(rgb):
+  return tuple(int(round(channel * 255)) for channel in rgb)
+
+
+def derive_palette(colors, background, extras=(), size=256):
+  # cards are the background, solid palette colours, gradients whose stops
+  # are any two palette colours and antialiased edges fading into the
+  # background, so the palette is those anchors plus evenly spaced ramps
+  # between every pair of them
+  anchors = []
+  for rgb in [background] + list(colors) + list(extras):
+    rgb = to_bytes(rgb)
+    if rgb not in anchors:
+      anchors.append(rgb)
+  pairs = list(itertools.combinations(anchors, 2))
+  steps = max(1, (size - len(anchors)) // max(len(pairs), 1))
+
+  palette = list(anchors)
+  seen = set(palette)
+  for start, end in pairs:
+    for step in range(1, steps + 1):
+      t = step / (steps + 1)
+      rgb = tuple(int(round(a + (b - a) * t)) for a, b in zip(start, end))
+      if rgb not in seen and len(palette) < size:
+        seen.add(rgb)
+        palette.append(rgb)
+  return palette
+
+
+@functools.lru_cache(maxsize=16)
+def nearest_table(palette):
+  # the nearest palette index for every colour at 5 bits per channel,
+  # measured from the middle of each cell. Squared distances are split per
+  # channel, scaled by 256 and carry the index in the low byte, so min()
+  # over their sums picks the nearest entry and, on a tie, the first one.
+  # Blue runs in stretches of 8 cells; an entry whose closest blue in the
+  # stretch cannot beat the best entry's farthest blue is left out there
+  centres = [c * 8 + 4 for c in range(32)]
+  reds = [[(v - r) * (v - r) << 8 for r, g, b in palette] for v in centres]
+  greens = [[(v - g) * (v - g) << 8 for r, g, b in palette] for v in centres]
+  blues = [[((v - b) * (v - b) << 8) + i for i, (r, g, b) in enumerate(palette)]
+           for v in centres]
+  stretches = []
+  for start in range(0, 32, 8):
+    stretch = blues[start:start + 8]
+    stretches.append((stretch, [min(column) for column in zip(*stretch)],
+                      [max(column) for column in zip(*stretch)]))
+
+  table = bytearray(32 * 32 * 32)
+  cell = 0
+  for red in reds:
+    for green in greens:
+      base = list(map(operator.add, red, green))
+      for stretch, nearest_blue, farthest_blue in stretches:
+        bound = min(map(operator.add, base, farthest_blue))
+        kept = [i for i, distance in enumerate(map(operator.add, base, nearest_blue))
+                if distance <= bound]
+        kept_base = [base[i] for i in kept]
+        for blue in stretch:
+          table[cell] = min(map(operator.add, kept_base,
+                                [blue[i] for i in kept])) & 255
+          cell += 1
+  # a cell holding palette entries maps to the first of them, so exact
+  # palette colours such as the background are kept rather than swapped
+  # for whatever lies nearest the middle of their cell
+  for i in reversed(range(len(palette))):
+    r, g, b = palette[i]
+    table[(r >> 3) << 10 | (g >> 3) << 5 | b >> 3] = i
+  return table
+
+
+def quantize(pixels, palette):
+  # pixels are native endian ARGB32 words with premultiplied alpha. Each
+  # distinct word is unpremultiplied once and mapped through the palette's
+  # 5 bit per channel table.
+  table = nearest_table(tuple(palette))
+  lookup = {}
+  for word in set(pixels):
+    alpha = word >> 24
+    if alpha == 0:
+      lookup[word] = 0
+      continue
+    r = ((word >> 16) & 255) * 255 // alpha
+    g = ((word >> 8) & 255) * 255 // alpha
+    b = (word & 255) * 255 // alpha
+    lookup[word] = table[(r >> 3) << 10 | (g >> 3) << 5 | b >> 3]
+  return lookup
+
+
+def chunk(kind, data):
+  return (struct.pack(">I", len(data)) + kind + data +
+          struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+
+
+def write_indexed_png(surface, filename, palette):
+  surface.flush()
+  width, height = surface.get_width(), surface.get_height()
+  words_per_row = surface.get_stride() // 4
+  pixels = surface.get_data().cast("I")
+  lookup = quantize(pixels, palette)
+
+  rows = bytearray()
+  for y in range(height):
+    start = y * words_per_row
+    rows.append(0)
+    rows += bytes(map(lookup.__getitem__, pixels[start:start + width]))
+
+  header = struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)
+  plte = bytes(channel for rgb in palette for channel in rgb)
+  with open(filename, "wb") as out:
+    out.write(PNG_SIGNATURE)
+    out.write(chunk(b"IHDR", header))
+    out.write(chunk(b"PLTE", plte))
+    out.write(chunk(b"IDAT", zlib.compress(bytes(rows), 9)))
+    out.write(chunk(b"IEND", b""))
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+
+from collections import namedtuple
+
+
+# Scale dependent layout values shared by a render. Instances are never
+# modified in place, so one state can be handed to any number of writers
+# (and threads); a different scale or line width means a new state.
+class RenderState(namedtuple("RenderState", ["scale",
+                                             "x_scaled",
+                                             "y_scaled",
+                                             "XPAD",
+                                             "YPAD",
+                                             "LINE_WIDTH"])):
+  __slots__ = ()
+
+  @classmethod
+  def for_glyph(cls, width, height, line_width, xpad, ypad, scale):
+    return cls(scale,
+               width * scale,
+               height * scale,
+               xpad * scale,
+               ypad * scale,
+               line_width * scale)
+
+  def rescaled(self, width, height, scale):
+    # glyph size is taken from the base size while padding and line width
+    # compound with the current state, matching how inscriptions have
+    # always been shrunk to fit inside a sigil
+    return self._replace(scale=scale,
+                         x_scaled=width * scale,
+                         y_scaled=height * scale,
+                         XPAD=self.XPAD * scale,
+                         YPAD=self.YPAD * scale,
+                         LINE_WIDTH=self.LINE_WIDTH * scale)
+
+  def with_line_width(self, line_width):
+    return self._replace(LINE_WIDTH=line_width)
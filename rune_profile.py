@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+from collections import defaultdict
+import threading
+import time
+import character_writer as CW
+
+PATH_OPS = {"new_path", "move_to", "rel_move_to", "line_to", "rel_line_to",
+            "curve_to", "rel_curve_to", "arc", "arc_negative", "rectangle",
+            "close_path", "append_path", "stroke", "fill"}
+
+# collapsed stacks are split on spaces, so blank runes need a name
+FRAME_NAMES = {" ": "space", "": "nothing"}
+
+
+# Stands in for the writer's context while a profiled rune runs, counting
+# the path operations it issues.
+class CountingContext:
+  def __init__(self, ctx, profiler):
+    self.ctx = ctx
+    self.profiler = profiler
+
+  def __getattr__(self, name):
+    attr = getattr(self.ctx, name)
+    if name not in PATH_OPS:
+      return attr
+    def counted(*args):
+      self.profiler.count_op()
+      return attr(*args)
+    return counted
+
+
+# Collects calls, time and path operations per (style, rune) from writers
+# whose rune tables it wraps. Numeric runes are reported as "#0".."#5".
+class RuneProfiler:
+  def __init__(self):
+    self.calls = defaultdict(int)
+    self.seconds = defaultdict(float)
+    self.ops = defaultdict(int)
+    self.stacks = defaultdict(float)
+    self.lock = threading.Lock()
+    self.local = threading.local()
+
+  def frames(self):
+    if not hasattr(self.local, "frames"):
+      self.local.frames = []
+    return self.local.frames
+
+  def count_op(self):
+    frames = self.frames()
+    if frames:
+      frames[-1][2] += 1
+
+  def wrap(self, writer, rune, draw):
+    style_names = {style: name for name, style in writer.STYLES.items()}
+
+    def profiled():
+      frames = self.frames()
+      key = (style_names.get(writer.style, str(writer.style)), rune)
+      frames.append([key, 0.0, 0])
+      ctx = writer.ctx
+      if not isinstance(ctx, CountingContext):
+        writer.ctx = CountingContext(ctx, self)
+      start = time.perf_counter()
+      try:
+        result = draw()
+        if len(frames) == 1:
+          # the writer batches its strokes until flush(); rasterizing a
+          # top level rune's strokes here charges them to that rune
+          writer.flush()
+        return result
+      finally:
+        elapsed = time.perf_counter() - start
+        writer.ctx = ctx
+        key, child_seconds, ops = frames.pop()
+        stack = (key[0],) + tuple(frame[0][1] for frame in frames) + (rune,)
+        with self.lock:
+          self.calls[key] += 1
+          self.seconds[key] += elapsed
+          self.ops[key] += ops
+          self.stacks[stack] += elapsed - child_seconds
+        if frames:
+          frames[-1][1] += elapsed
+          frames[-1][2] += ops
+    return profiled
+
+  def ranked(self):
+    rows = []
+    for key in self.calls:
+      calls = self.calls[key]
+      rows.append({"style": key[0],
+                   "rune": key[1],
+                   "calls": calls,
+                   "total_ms": self.seconds[key] * 1000,
+                   "mean_us": self.seconds[key] / calls * 1e6,
+                   "ops_per_call": self.ops[key] / calls})
+    rows.sort(key=lambda row: row["total_ms"], reverse=True)
+    return rows
+
+  def report(self, limit=None):
+    lines = ["%-8s %-6s %8s %10s %10s %8s" % ("style", "rune", "calls",
+                                              "total ms", "mean us", "ops")]
+    for row in self.ranked()[:limit]:
+      lines.append("%-8s %-6s %8d %10.2f %10.1f %8.1f" % (
+        row["style"], repr(row["rune"])[1:-1], row["calls"], row["total_ms"],
+        row["mean_us"], row["ops_per_call"]))
+    return "\n".join(lines)
+
+  def collapsed(self):
+    # "style;rune;nested microseconds" lines, as read by flamegraph.pl and
+    # speedscope
+    return ["%s %d" % (";".join(FRAME_NAMES.get(part, repr(part)[1:-1])
+                                for part in stack), round(seconds * 1e6))
+            for stack, seconds in sorted(self.stacks.items())]
+
+
+def main(infile="input.txt", outfile="runes.folded", scale=1):
+  profiler = RuneProfiler()
+  for style in CW.CharacterWriter.STYLES:
+    cw = CW.CharacterWriter(scale, profiler=profiler)
+    cw.style = cw.STYLES[style]
+    width, height, insc_lines = cw.parse_file(infile)
+    cw.generate_default_context(width, height)
+    for inscription in insc_lines:
+      cw.write_inscription(inscription)
+  print(profiler.report(limit=40))
+  with open(outfile, "w") as out:
+    out.write("\n".join(profiler.collapsed()) + "\n")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+
+from math import ceil, pi, sin, cos
+
+# Path ops for the school and shape sigils. Offsets and radii are in units
+# of SigilWriter.small_r around the sigil centre.
+#   ("arc", x, y, rad, angle_1, angle_2)   stroked arc
+#   ("fill_arc", x, y, rad, angle_1, angle_2)
+#   ("line", x1, y1, x2, y2)
+#   ("move_to", x, y)
+#   ("line_to", x, y)
+#   ("curve_to", x1, y1, x2, y2, x3, y3)
+#   ("stroke",)
+
+
+def polar(angle, radius):
+  angle = angle % (2*pi)
+  return cos(angle) * radius, sin(angle) * radius
+
+
+def conjuration():
+  return (("arc", 0, 1/2, 1/2, pi, 2*pi),
+          ("line", 0, -1/4, 0, -3/4),
+          ("line", 3/8, -1/4, 5/8, -1/2),
+          ("line", -3/8, -1/4, -5/8, -1/2),
+          ("stroke",))
+
+
+def necromancy():
+  offset = 1/8
+  line_off_x, line_off_y = polar(3*pi/4, 5*offset)
+  return (("arc", 0, -offset, 5*offset, 3*pi/4, 9*pi/4),
+          ("move_to", line_off_x, -offset + line_off_y),
+          ("line_to", line_off_x, 2*offset + line_off_y),
+          ("line_to", -line_off_x, 2*offset + line_off_y),
+          ("line_to", -line_off_x, -offset + line_off_y),
+          ("line", line_off_x + offset, line_off_y + offset/2,
+                   -line_off_x - offset, line_off_y + offset/2),
+          ("line", 0, offset, offset/2, 2*offset),
+          ("line", 0, offset, -offset/2, 2*offset),
+          ("arc", line_off_x/2, -offset, offset, 0, 2*pi),
+          ("arc", -line_off_x/2, -offset, offset, 0, 2*pi),
+          ("stroke",))
+
+
+def evocation():
+  return (("arc", 0, 0, 1/8, 0, 2*pi),
+          ("line", 0, -3/8, 0, -3/4),
+          ("line", 3/8, -1/4, 5/8, -1/2),
+          ("line", -3/8, -1/4, -5/8, -1/2),
+          ("line", 0, 3/8, 0, 3/4),
+          ("line", 3/8, 1/4, 5/8, 1/2),
+          ("line", -3/8, 1/4, -5/8, 1/2),
+          ("stroke",))
+
+
+def abjuration():
+  vert_offset = 2/3
+  horiz_offset = 1/2
+  return (("line", horiz_offset, -vert_offset, -horiz_offset, -vert_offset),
+          ("line_to", -horiz_offset, vert_offset/2),
+          ("line_to", 0, vert_offset),
+          ("line_to", horiz_offset, vert_offset/2),
+          ("line_to", horiz_offset, -vert_offset),
+          ("line", 0, -vert_offset, 0, vert_offset),
+          ("line", horiz_offset, -vert_offset/4, 0, 0),
+          ("line", -horiz_offset, -vert_offset/4, 0, 0),
+          ("stroke",))
+
+
+def transmutation():
+  horiz_offset = 1/3
+  return (("fill_arc", -horiz_offset, 0, 1/2, pi/4, pi*7/4),
+          ("fill_arc", horiz_offset, 0, 1/2, pi*5/4, pi*11/4))
+
+
+def divination():
+  return (("arc", 0, -1/2, 1/2, 0, pi),
+          ("line", 0, 1/4, 0, 3/4),
+          ("line", 3/8, 1/4, 5/8, 1/2),
+          ("line", -3/8, 1/4, -5/8, 1/2),
+          ("stroke",))
+
+
+def enchantment():
+  pitch = 8
+  ops = []
+  for i in range(1, pitch):
+    if (i % 2 == 1):
+      ops.append(("arc", 1/pitch, 0, i/pitch, pi, 2*pi))
+    else:
+      ops.append(("arc", 0, 0, i/pitch, 0, pi))
+  return tuple(ops)
+
+
+def illusion():
+  eye_rad = 1/3
+  vert_offset = 1/6
+  return (("arc", 0, 0, eye_rad, pi, 2*pi),
+          ("line", -eye_rad, 0, -2*eye_rad, 0),
+          ("line", eye_rad, 0, 2*eye_rad, 0),
+          ("arc", 0, vert_offset*2, eye_rad, 0, pi),
+          ("line", -eye_rad, vert_offset*2, -2*eye_rad, vert_offset*2),
+          ("line", eye_rad, vert_offset*2, 2*eye_rad, vert_offset*2),
+          ("arc", 0, vert_offset, eye_rad/2, 0, 2*pi),
+          ("line", 0, -eye_rad, 0, -3/4),
+          ("line", 3/8, -1/4, 5/8, -1/2),
+          ("line", -3/8, -1/4, -5/8, -1/2),
+          ("stroke",))
+
+
+def square():
+  x_off, y_off = polar(pi/4, 1)
+  x_off -= 1/10
+  y_off -= 1/10
+  return (("line", x_off, y_off, -x_off, y_off),
+          ("line_to", -x_off, -y_off),
+          ("line_to", x_off, -y_off),
+          ("line_to", x_off, y_off),
+          ("stroke",))
+
+
+def circle():
+  return (("arc", 0, 0, 5/7, 0, 2*pi),)
+
+
+def cone():
+  x_base, y_base = polar(pi/2, 1)
+  x_left, y_left = polar(5*pi/4, 1)
+  x_right, y_right = polar(7*pi/4, 1)
+  return (("line", x_base, y_base, x_left, y_left),
+          ("line", x_base, y_base, x_right, y_right),
+          ("stroke",))
+
+
+def heart(flip):
+  return (("move_to", 0, -flip/3),
+          ("curve_to", 1/3, -flip*1.25, 1.5, 0, 0, flip*0.8),
+          ("move_to", 0, -flip/3),
+          ("curve_to", -1/3, -flip*1.25, -1.5, 0, 0, flip*0.8),
+          ("stroke",))
+
+
+def d4():
+  offset = 1/10
+  x1, y1 = polar(pi/6, 1)
+  x2, y2 = polar(5*pi/6, 1)
+  return (("line", 0, -1 + offset, x1 - offset, y1 - offset),
+          ("line_to", x2 + offset, y2 - offset),
+          ("line_to", 0, -1 + offset),
+          ("stroke",))
+
+
+def d8():
+  offset = 9/10
+  return (("line", 0, -offset, offset, 0),
+          ("line_to", 0, offset),
+          ("line_to", -offset, 0),
+          ("line_to", 0, -offset),
+          ("stroke",))
+
+
+def d10():
+  offset = 1/10
+  x1, y1 = polar(pi/6, 1)
+  x2, y2 = polar(5*pi/6, 1)
+  return (("line", 0, -1 + offset, x1 - offset, y1 - offset),
+          ("line_to", 0, 1 - offset),
+          ("line_to", x2 + offset, y2 - offset),
+          ("line_to", 0, -1 + offset),
+          ("stroke",))
+
+
+def d12():
+  rad = 0.8
+  inc = 2 * pi / 5
+  start = pi/2
+  ops = [("move_to",) + polar(start, rad)]
+  for i in range(1, 6):
+    ops.append(("line_to",) + polar(start + inc*i, rad))
+  ops.append(("stroke",))
+  return tuple(ops)
+
+
+SCHOOL_SIGILS = {
+  "CONJURATION":   conjuration(),
+  "NECROMANCY":    necromancy(),
+  "EVOCATION":     evocation(),
+  "ABJURATION":    abjuration(),
+  "TRANSMUTATION": transmutation(),
+  "DIVINATION":    divination(),
+  "ENCHANTMENT":   enchantment(),
+  "ILLUSION":      illusion()
+}
+
+def simplified(ops, step=pi/6):
+  # the sigil for drafts, as one path stroked once: arcs become chords
+  # every step radians and curves straight lines to their end points.
+  # Filled dots are kept as they are.
+  draft = []
+  for op in ops:
+    if op[0] == "arc":
+      x, y, rad, angle_1, angle_2 = op[1:]
+      while angle_2 < angle_1:
+        angle_2 += 2*pi
+      count = max(2, ceil((angle_2 - angle_1) / step))
+      for i in range(count + 1):
+        dx, dy = polar(angle_1 + (angle_2 - angle_1) * i / count, rad)
+        draft.append(("line_to" if i else "move_to", x + dx, y + dy))
+    elif op[0] == "curve_to":
+      draft.append(("line_to",) + op[5:7])
+    else:
+      draft.append(op)
+  if draft and draft[-1][0] not in ("stroke", "fill_arc"):
+    draft.append(("stroke",))
+  return tuple(draft)
+
+
+DRAFT_SCHOOL_SIGILS = {school: simplified(ops)
+                       for school, ops in SCHOOL_SIGILS.items()}
+
+SHAPE_SIGILS = {
+  "SQUARE":   square(),
+  "D6":       square(),
+  "CIRCLE":   circle(),
+  "CONE":     cone(),
+  "SELF":     heart(1),
+  "CREATURE": heart(-1),
+  "D4":       d4(),
+  "D8":       d8(),
+  "D10":      d10(),
+  "D12":      d12()
+}
@@ -1,11 +1,24 @@
 #!/usr/bin/env python
 
 from math import pi, sin, cos
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import functools
 import cairo
 import character_writer as CW
+import cost
+import display_list as DL
+from render_state import RenderState
+import path_cache
+import png_writer
+import sigils
+import spells
+import surfaces
 import random
 import os
-import csv
+
+# (kind, name, RenderState) -> compiled drawing steps
+PLANS = {}
 
 class SigilWriter:
   GLYPH_WIDTH, GLYPH_HEIGHT = 500, 500
@@ -18,7 +31,11 @@ class SigilWriter:
                char_height=1,
                ctx=None,
                surface=None,
-               palette=None):
+               palette=None,
+               seed=None,
+               record=False,
+               draft=False,
+               display_list=False):
 
     if palette is not None:
       self.palette = palette
@@ -27,20 +44,34 @@ class SigilWriter:
                       (0, 1, 0),
                       (0, 0, 1)]
 
-    self.process_scale(scale)
-    self.cursor_x = self.XPAD + self.LINE_WIDTH + self.x_scaled / 2
-    self.cursor_y = self.YPAD + self.LINE_WIDTH + self.y_scaled / 2
+    self.rng = random.Random(seed)
+    self.record = record
+    # with display_list the card is recorded as a DL.DisplayList, which
+    # exports to svg, json or png
+    self.display_list = display_list
+    # a draft card is smaller, antialiased with draft (True, "fast" or
+    # "none"), drawn in solid colours and gets outline school sigils
+    self.draft = draft
+    if draft and ctx is None:
+      scale *= surfaces.DRAFT_SCALE
+    self.state = self.state_for_scale(scale)
+    self.pixel_width, self.pixel_height = self.canvas_size(self.state)
+    self.cursor_x = self.state.XPAD + self.state.LINE_WIDTH + self.state.x_scaled / 2
+    self.cursor_y = self.state.YPAD + self.state.LINE_WIDTH + self.state.y_scaled / 2
     self.x_home = self.cursor_x
     self.y_home = self.cursor_y
     if ctx is not None and surface is not None:
       self.ctx = ctx
       self.surface = surface
-      self.ctx.set_line_width(self.LINE_WIDTH)
+      self.ctx.set_line_width(self.state.LINE_WIDTH)
       self.ctx.set_line_join(cairo.LINE_JOIN_ROUND)
       self.ctx.set_line_cap(cairo.LINE_CAP_ROUND)
+      if draft:
+        self.ctx.set_antialias(surfaces.draft_antialias(draft))
       self.ctx.save()
       self.writer_scale = scale / 1.5
-      self.writer = CW.CharacterWriter(scale / 1.5, ctx=self.ctx, surface=self.surface)
+      self.writer = CW.CharacterWriter(scale / 1.5, ctx=self.ctx,
+                                       surface=self.surface, draft=draft)
       self.ctx.restore()
     else:
       self.generate_default_context()
@@ -69,42 +100,74 @@ class SigilWriter:
       "CHA"   :  self.cha_save
     }
 
-  def generate_default_context(self):
-    self.pixel_width = int((self.x_scaled + self.XPAD * 2) + 2 * self.LINE_WIDTH)
-    self.pixel_height = int((self.y_scaled + self.YPAD * 2) + 2 * self.LINE_WIDTH)
-    self.surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.pixel_width,
-                                      self.pixel_height)
-    ctx = cairo.Context(self.surface)
-    ctx.set_source_rgb(0, 0, 0)
-    ctx.rectangle(0, 0, self.pixel_width, self.pixel_height)
-    ctx.fill()
-    pat = cairo.RadialGradient(self.cursor_x, self.cursor_y, 0.0, self.cursor_x, self.cursor_y, max(self.pixel_width, self.pixel_height)/2)
-    # add_color_stop_rbga(offset, % red, % green, % blue, % opacity)
-    num_stops = len(self.palette)*2
-    for i in range(num_stops):
-      r, g, b = self.palette[i%len(self.palette)]
-      pat.add_color_stop_rgb(1/num_stops * i, r, g, b)
+  def state_for_scale(self, scale):
+    return RenderState.for_glyph(self.GLYPH_WIDTH, self.GLYPH_HEIGHT,
+                                 self.LINE_WIDTH, self.XPAD, self.YPAD, scale)
+
+  def canvas_size(self, state):
+    pixel_width = int((state.x_scaled + state.XPAD * 2) + 2 * state.LINE_WIDTH)
+    pixel_height = int((state.y_scaled + state.YPAD * 2) + 2 * state.LINE_WIDTH)
+    return pixel_width, pixel_height
 
-    ctx.set_source(pat)
+  def generate_default_context(self):
+    if self.display_list:
+      self.surface = DL.DisplayList(self.pixel_width, self.pixel_height,
+                                    (0, 0, 0))
+      ctx = self.surface
+    else:
+      self.surface = surfaces.new_filled_surface(self.pixel_width,
+                                                 self.pixel_height, (0, 0, 0),
+                                                 record=self.record,
+                                                 state=self.state)
+      ctx = cairo.Context(self.surface)
+    if self.draft:
+      ctx.set_antialias(surfaces.draft_antialias(self.draft))
+      ctx.set_source_rgb(*self.palette[0])
+    else:
+      radius = max(self.pixel_width, self.pixel_height)/2
+      ctx.set_source(palette_gradient(self.cursor_x, self.cursor_y, radius,
+                                      tuple(self.palette)))
     self.ctx = ctx
 
-    self.ctx.set_line_width(self.LINE_WIDTH)
+    self.ctx.set_line_width(self.state.LINE_WIDTH)
     self.ctx.set_line_cap(cairo.LINE_CAP_ROUND)
     self.ctx.save()
-    self.writer_scale = self.scale / 1.5
-    self.writer = CW.CharacterWriter(self.scale / 1.5, ctx=self.ctx, surface=self.surface)
+    self.writer_scale = self.state.scale / 1.5
+    self.writer = CW.CharacterWriter(self.state.scale / 1.5, ctx=self.ctx,
+                                     surface=self.surface, draft=self.draft)
     self.ctx.restore()
 
-  def export_image(self, filename="example.png"):
-    self.surface.write_to_png(filename)  # Output to PNG
+  def export_image(self, filename="example.png", indexed=False):
+    if self.display_list:
+      self.surface.optimized().export(filename,
+                                      self.index_palette() if indexed else None)
+    elif self.record and filename.endswith(".pdf"):
+      surfaces.write_pdf(self.surface, filename, self.pixel_width,
+                         self.pixel_height)
+    elif indexed:
+      image = self.rasterize([self.state.scale])[0] if self.record else self.surface
+      png_writer.write_indexed_png(image, filename, self.index_palette())
+    elif self.record:
+      self.rasterize([self.state.scale])[0].write_to_png(filename)
+    else:
+      self.surface.write_to_png(filename)  # Output to PNG
+
+  def index_palette(self):
+    return png_writer.derive_palette(self.palette, (0, 0, 0),
+                                     [(249/255, 190/255, 25/255)])
+
+  def rasterize(self, scales):
+    images = []
+    for scale in scales:
+      width, height = self.canvas_size(self.state_for_scale(scale))
+      images.append(surfaces.replay(self.surface, scale / self.state.scale,
+                                    width, height))
+    return images
 
-  def process_scale(self, scale):
-    self.scale = scale
-    self.x_scaled = self.GLYPH_WIDTH * scale
-    self.y_scaled = self.GLYPH_HEIGHT * scale
-    self.XPAD *= scale
-    self.YPAD *= scale
-    self.LINE_WIDTH *= scale
+  def export_images(self, filenames):
+    scales = list(filenames)
+    for scale, image in zip(scales, self.rasterize(scales)):
+      image.write_to_png(filenames[scale])
 
   def hex_to_rgb(self, hex_color_str):
     if len(hex_color_str) == 7 and hex_color_str[0] == "#":
@@ -118,10 +181,10 @@ class SigilWriter:
     return (r,g,b)
 
   def rel_to_user_x(self, rel_x):
-    return rel_x * self.x_scaled + self.cursor_x
+    return rel_x * self.state.x_scaled + self.cursor_x
 
   def rel_to_user_y(self, rel_y):
-    return rel_y * self.y_scaled + self.cursor_y
+    return rel_y * self.state.y_scaled + self.cursor_y
 
   def x_y_from_angle(self, angle, radius):
     angle = angle % (2*pi)
@@ -144,31 +207,45 @@ class SigilWriter:
     self.ctx.new_path()
     self.move_to(rel_x, rel_y)
 
-  def arc(self, rel_x, rel_y, rad, angle_1, angle_2, fill=False):
-    self.ctx.save()
+  def add_arc(self, rel_x, rel_y, rad, angle_1, angle_2):
+    # cards are square, so an arc in card units is a circle in user space
+    # and needs no transform of its own
     self.ctx.new_sub_path()
-    self.ctx.translate(self.cursor_x, self.cursor_y)
-    self.ctx.scale(self.x_scaled, self.y_scaled)
-    self.ctx.set_line_width(self.LINE_WIDTH / self.x_scaled * 0.75)
-    self.ctx.arc(rel_x, rel_y, rad, angle_1, angle_2)
+    self.ctx.arc(self.rel_to_user_x(rel_x), self.rel_to_user_y(rel_y),
+                 rad * self.state.x_scaled, angle_1, angle_2)
+
+  def arc(self, rel_x, rel_y, rad, angle_1, angle_2, fill=False, line_width=None):
+    self.add_arc(rel_x, rel_y, rad, angle_1, angle_2)
     if fill:
       self.fill()
     else:
-      self.stroke()
+      self.stroke_arcs(line_width)
+
+  def stroke_arcs(self, line_width=None):
+    if line_width is None:
+      line_width = self.state.LINE_WIDTH
+    # stroked through the card scale, as the arcs were before they were
+    # batched; cairo's stroker antialiases a little differently in user
+    # space
+    self.ctx.save()
+    self.ctx.translate(self.cursor_x, self.cursor_y)
+    self.ctx.scale(self.state.x_scaled, self.state.y_scaled)
+    self.ctx.set_line_width(line_width / self.state.x_scaled * 0.75)
+    self.stroke()
     self.ctx.restore()
 
-  def overwriting_arc(self, rel_x, rel_y, rad, angle_1, angle_2):
+  def overwriting_arc(self, rel_x, rel_y, rad, angle_1, angle_2, line_width=None):
     self.ctx.save()
     self.ctx.set_source_rgb(0, 0, 0)
-    self.arc(rel_x, rel_y, rad, 0, 2*pi, fill=True)
+    self.arc(rel_x, rel_y, rad, 0, 2*pi, fill=True, line_width=line_width)
     self.ctx.restore()
-    self.arc(rel_x, rel_y, rad, 0, 2*pi) 
+    self.arc(rel_x, rel_y, rad, 0, 2*pi, line_width=line_width)
 
   def move_to(self, rel_x, rel_y):
     self.ctx.move_to(self.rel_to_user_x(rel_x), self.rel_to_user_y(rel_y))
 
   def rel_move(self, dx, dy):
-    self.ctx.rel_move_to(dx * self.x_scaled, dy * self.y_scaled)
+    self.ctx.rel_move_to(dx * self.state.x_scaled, dy * self.state.y_scaled)
 
   def line_to(self, rel_x, rel_y):
     self.ctx.line_to(self.rel_to_user_x(rel_x), self.rel_to_user_y(rel_y))
@@ -194,43 +271,44 @@ class SigilWriter:
 
     base8=base3
     inc8 = 2*pi/8
+    coords = dict.fromkeys(self.coords)
     if not equidistant:
-      self.coords["LEVEL"]    = self.x_y_from_angle(base3 + inc3 * 0, rad3)
-      self.coords["C/R"]      = self.x_y_from_angle(base3 + inc3 * 1, rad3)
-      self.coords["CASTINGTIME"]     = self.x_y_from_angle(base3 + inc3 * 2, rad3)
-      self.coords["DURATION"] = self.x_y_from_angle(base5 + inc5 * 0, rad5)
-      self.coords["TARGET"]   = self.x_y_from_angle(base5 + inc5 * 1, rad5)
-      self.coords["SCHOOL"]   = self.x_y_from_angle(base5 + inc5 * 2, rad5)
-      self.coords["DAMAGE"]   = self.x_y_from_angle(base5 + inc5 * 3, rad5)
-      self.coords["RANGE"]    = self.x_y_from_angle(base5 + inc5 * 4, rad5)
+      coords["LEVEL"]    = self.x_y_from_angle(base3 + inc3 * 0, rad3)
+      coords["C/R"]      = self.x_y_from_angle(base3 + inc3 * 1, rad3)
+      coords["CASTINGTIME"]     = self.x_y_from_angle(base3 + inc3 * 2, rad3)
+      coords["DURATION"] = self.x_y_from_angle(base5 + inc5 * 0, rad5)
+      coords["TARGET"]   = self.x_y_from_angle(base5 + inc5 * 1, rad5)
+      coords["SCHOOL"]   = self.x_y_from_angle(base5 + inc5 * 2, rad5)
+      coords["DAMAGE"]   = self.x_y_from_angle(base5 + inc5 * 3, rad5)
+      coords["RANGE"]    = self.x_y_from_angle(base5 + inc5 * 4, rad5)
     else:
-      self.coords["LEVEL"]    = self.x_y_from_angle(base8 + inc8 * 0, rad3)
-      self.coords["DURATION"] = self.x_y_from_angle(base8 + inc8 * 1, rad5)
-      self.coords["TARGET"]   = self.x_y_from_angle(base8 + inc8 * 2, rad5)
-      self.coords["C/R"]      = self.x_y_from_angle(base8 + inc8 * 3, rad3)
-      self.coords["SCHOOL"]   = self.x_y_from_angle(base8 + inc8 * 4, rad5)
-      self.coords["CASTINGTIME"]     = self.x_y_from_angle(base8 + inc8 * 5, rad3)
-      self.coords["DAMAGE"]   = self.x_y_from_angle(base8 + inc8 * 6, rad5)
-      self.coords["RANGE"]    = self.x_y_from_angle(base8 + inc8 * 7, rad5)
+      coords["LEVEL"]    = self.x_y_from_angle(base8 + inc8 * 0, rad3)
+      coords["DURATION"] = self.x_y_from_angle(base8 + inc8 * 1, rad5)
+      coords["TARGET"]   = self.x_y_from_angle(base8 + inc8 * 2, rad5)
+      coords["C/R"]      = self.x_y_from_angle(base8 + inc8 * 3, rad3)
+      coords["SCHOOL"]   = self.x_y_from_angle(base8 + inc8 * 4, rad5)
+      coords["CASTINGTIME"]     = self.x_y_from_angle(base8 + inc8 * 5, rad3)
+      coords["DAMAGE"]   = self.x_y_from_angle(base8 + inc8 * 6, rad5)
+      coords["RANGE"]    = self.x_y_from_angle(base8 + inc8 * 7, rad5)
+    return coords
 
   def draw_sigil_circles(self):
-    self.LINE_WIDTH /= 2
-    self.ctx.set_line_width(self.LINE_WIDTH)
+    line_width = self.state.LINE_WIDTH / 2
+    self.ctx.set_line_width(line_width)
     count = 0
     for key in self.coords:
       x, y = self.coords[key]
       if count < 3:
-        self.overwriting_arc(x, y, self.big_r, 0, 2*pi)
+        self.overwriting_arc(x, y, self.big_r, 0, 2*pi, line_width=line_width)
       else:
-        self.overwriting_arc(x, y, self.small_r, 0, 2*pi)
+        self.overwriting_arc(x, y, self.small_r, 0, 2*pi, line_width=line_width)
       count += 1
-    self.LINE_WIDTH *= 2
-    self.ctx.set_line_width(self.LINE_WIDTH)
+    self.ctx.set_line_width(self.state.LINE_WIDTH)
 
   def no_save(self):
     self.init_cursor()
     rad3, rad5 = .125, .4
-    self.find_key_coords(rad3, rad5)
+    self.coords = self.find_key_coords(rad3, rad5)
     keys = list(self.coords.keys())
     self.use_random_gradient()
     self.arc(0, 0, rad5, 0, 2 * pi)
@@ -251,7 +329,7 @@ class SigilWriter:
     self.init_cursor()
 
     rad3, rad5 = .175, .45
-    self.find_key_coords(rad3, rad5)
+    self.coords = self.find_key_coords(rad3, rad5)
     keys = list(self.coords.keys())
     self.use_random_gradient()
     for i in range(5):
@@ -269,7 +347,7 @@ class SigilWriter:
     self.init_cursor()
 
     rad3, rad5 = .4, .25
-    self.find_key_coords(rad3, rad5, equidistant=True)
+    self.coords = self.find_key_coords(rad3, rad5, equidistant=True)
     keys = list(self.coords.keys())
 
     for i in range(8):
@@ -284,7 +362,7 @@ class SigilWriter:
     self.init_cursor()
 
     rad3, rad5 = .15, .4
-    self.find_key_coords(rad3, rad5)
+    self.coords = self.find_key_coords(rad3, rad5)
     for i in range(5):
       inc5 = 2*pi/5
       base5 = pi/2 - 2*inc5
@@ -303,7 +381,7 @@ class SigilWriter:
     self.init_cursor()
 
     rad3, rad5 = .175, .4
-    self.find_key_coords(rad3, rad5)
+    self.coords = self.find_key_coords(rad3, rad5)
     keys = list(self.coords.keys())
     self.use_random_gradient()
     self.arc(0,0,rad3,0,2*pi)
@@ -326,7 +404,7 @@ class SigilWriter:
     self.init_cursor()
     self.use_random_gradient()
     rad3, rad5 = .42, .16
-    self.find_key_coords(rad3, rad5)
+    self.coords = self.find_key_coords(rad3, rad5)
     for i in range(3):
       inc3 = 2*pi/3
       base3 = 3*pi/2
@@ -344,7 +422,7 @@ class SigilWriter:
     self.init_cursor()
 
     rad3, rad5 = .175, .4
-    self.find_key_coords(rad3, rad5)
+    self.coords = self.find_key_coords(rad3, rad5)
     keys = list(self.coords.keys())
     self.use_random_gradient()
     self.arc(0,0,rad5,0,2*pi)
@@ -360,7 +438,7 @@ class SigilWriter:
     self.init_cursor()
 
     rad3, rad5 = .4, .175
-    self.find_key_coords(rad3, rad5)
+    self.coords = self.find_key_coords(rad3, rad5)
     keys = list(self.coords.keys())
     self.use_random_gradient()
     self.arc(0,0,rad3,0,2*pi)
@@ -372,98 +450,95 @@ class SigilWriter:
     self.use_random_gradient()
     self.draw_sigil_circles()
 
+  def plan(self, kind, name, compile):
+    key = (kind, name, self.state)
+    plan = PLANS.get(key)
+    if plan is None:
+      plan = compile(name)
+      PLANS[key] = plan
+    return plan
+
+  def compile(self, draw):
+    # runs drawing code once against a recorder; only the gradients differ
+    # between cards, so those are left as steps to fill in on replay
+    compiler = copy.copy(self)
+    compiler.ctx = path_cache.PathRecorder()
+    compiler.ctx.set_line_width(self.state.LINE_WIDTH)
+    compiler.rng = random.Random(0)
+    draw(compiler)
+    return compiler
+
+  def compile_frame(self, save):
+    compiler = self.compile(self.draw_type[save].__func__)
+    return compiler.coords, compiler.ctx.steps
+
+  def compile_sigil(self, ops, x, y):
+    return self.compile(lambda compiler: compiler.trace_sigil(ops, x, y)).ctx.steps
+
+  def draw_frame(self, save):
+    coords, steps = self.plan("frame", save, self.compile_frame)
+    self.coords = dict(coords)
+    path_cache.replay(self.ctx, steps, self.use_random_gradient)
+    self.ctx.new_path()
+    self.ctx.set_line_width(self.state.LINE_WIDTH)
+
   def draw_school_sigil(self, school):
-    x, y = self.coords["SCHOOL"]
-    if school == "CONJURATION":
-      self.arc(x, y+self.small_r/2, self.small_r/2, pi, 2*pi)
-      self.line(x, y - self.small_r/4, x, y-3*self.small_r/4)
-      self.line(x + self.small_r * 3/8, y - self.small_r/4, x + self.small_r * 5/8, y - self.small_r/2)
-      self.line(x - self.small_r * 3/8, y - self.small_r/4, x - self.small_r * 5/8, y - self.small_r/2)
-      self.stroke()
-    elif school == "NECROMANCY":
-      offset = self.small_r/8
-      self.arc(x, y - offset, 5*offset, 3*pi/4, 9*pi/4)
-      line_off_x, line_off_y = self.x_y_from_angle(3*pi/4, 5*offset)
-      self.move_to(x + line_off_x, y - offset + line_off_y)
-      self.line_to(x + line_off_x, y + 2*offset + line_off_y)
-      self.line_to(x - line_off_x, y + 2*offset + line_off_y)
-      self.line_to(x - line_off_x, y - offset + line_off_y)
-      self.line(x + line_off_x + offset, y + line_off_y + offset/2, x - line_off_x - offset, y + line_off_y + offset/2)
-      self.line(x, y + offset, x + offset/2, y + 2*offset)
-      self.line(x, y + offset, x - offset/2, y + 2*offset)
-      self.arc(x + line_off_x/2, y - offset, offset, 0, 2*pi)
-      self.arc(x - line_off_x/2, y - offset, offset, 0, 2*pi)
-      self.stroke()
-    elif school == "EVOCATION":
-      self.arc(x, y, self.small_r/8, 0, 2*pi)
-      self.line(x, y - self.small_r * 3/8, x, y-3*self.small_r/4)
-      self.line(x + self.small_r * 3/8, y - self.small_r/4, x + self.small_r * 5/8, y - self.small_r/2)
-      self.line(x - self.small_r * 3/8, y - self.small_r/4, x - self.small_r * 5/8, y - self.small_r/2)
-
-      self.line(x, y + self.small_r * 3/8, x, y + self.small_r * 3/4)
-      self.line(x + self.small_r * 3/8, y + self.small_r/4, x + self.small_r * 5/8, y + self.small_r/2)
-      self.line(x - self.small_r * 3/8, y + self.small_r/4, x - self.small_r * 5/8, y + self.small_r/2)
-      self.stroke()
-    elif school == "ABJURATION":
-      vert_offset = self.small_r*2/3
-      horiz_offset = self.small_r/2
-      self.line(x + horiz_offset, y-vert_offset, x-horiz_offset, y-vert_offset)
-      self.line_to(x-horiz_offset, y+vert_offset/2)
-      self.line_to(x, y+vert_offset)
-      self.line_to(x + horiz_offset, y + vert_offset/2)
-      self.line_to(x + horiz_offset, y-vert_offset)
-      self.line(x, y-vert_offset, x, y+vert_offset)
-      self.line(x+horiz_offset, y-vert_offset/4, x, y)
-      self.line(x-horiz_offset, y-vert_offset/4, x, y)
-      self.stroke()
-    elif school == "TRANSMUTATION":
-      horiz_offset = self.small_r/3
-      self.arc(x - horiz_offset, y, self.small_r/2, pi/4, pi*7/4, fill=True)
-      self.arc(x + horiz_offset, y, self.small_r/2, pi*5/4, pi*11/4, fill=True)
-    elif school == "DIVINATION":
-      self.arc(x, y-self.small_r/2, self.small_r/2, 0, pi)
-      self.line(x, y + self.small_r * 1/4, x, y + self.small_r * 3/4)
-      self.line(x + self.small_r * 3/8, y + self.small_r/4, x + self.small_r * 5/8, y + self.small_r/2)
-      self.line(x - self.small_r * 3/8, y + self.small_r/4, x - self.small_r * 5/8, y + self.small_r/2)
-      self.stroke()
-    elif school == "ENCHANTMENT":
-      pitch = 8
-      for i in range(1, pitch):
-        if (i % 2 == 1):
-          self.arc(x + self.small_r/(pitch), y, i * self.small_r/pitch, pi, 2*pi)
-        else:
-          self.arc(x, y, i*self.small_r/pitch, 0, pi)
-    elif school == "ILLUSION":
-      self.ctx.save()
-      eye_rad = self.small_r/3
-      vert_offset = self.small_r/6
-      self.arc(x, y, eye_rad, pi, 2*pi)
-      self.line(x-eye_rad, y, x-2*eye_rad, y)
-      self.line(x+eye_rad, y, x+2*eye_rad, y)
-      self.arc(x, y+vert_offset*2, eye_rad, 0, pi)
-      self.line(x-eye_rad, y+vert_offset*2, x-2*eye_rad, y+vert_offset*2)
-      self.line(x+eye_rad, y+vert_offset*2, x+2*eye_rad, y+vert_offset*2)
-      self.arc(x, y+vert_offset, eye_rad/2, 0, 2*pi)
-
-      self.line(x, y - eye_rad, x, y-3*self.small_r/4)
-      self.line(x + self.small_r * 3/8, y - self.small_r/4, x + self.small_r * 5/8, y - self.small_r/2)
-      self.line(x - self.small_r * 3/8, y - self.small_r/4, x - self.small_r * 5/8, y - self.small_r/2)
-      self.stroke()
-    
+    if self.draft:
+      self.draw_library_sigil("SCHOOL", "draft_school",
+                              sigils.DRAFT_SCHOOL_SIGILS, school)
+    else:
+      self.draw_library_sigil("SCHOOL", "school", sigils.SCHOOL_SIGILS, school)
+
+  def trace_sigil(self, ops, x=0, y=0):
+    # traced in place around (x, y), so the replayed pixels match drawing
+    # the sigil there directly
+    r = self.small_r
+    for op in ops:
+      name = op[0]
+      if name in ("arc", "fill_arc"):
+        args = [x + op[1] * r, y + op[2] * r, op[3] * r]
+      else:
+        args = [(x, y)[i % 2] + v * r for i, v in enumerate(op[1:])]
+      if name == "arc":
+        self.arc(args[0], args[1], args[2], op[4], op[5])
+      elif name == "fill_arc":
+        self.arc(args[0], args[1], args[2], op[4], op[5], fill=True)
+      elif name == "line":
+        self.line(*args)
+      elif name == "move_to":
+        self.move_to(*args)
+      elif name == "line_to":
+        self.line_to(*args)
+      elif name == "curve_to":
+        self.curve_to(*args)
+      else:
+        self.stroke()
+
+  def draw_library_sigil(self, key, kind, library, name):
+    ops = library.get(name)
+    if ops is None:
+      return
+    # traced at its place on the card from the writer's own user space, so
+    # replay puts it under whatever matrix the context has now
+    x, y = self.coords[key]
+    steps = self.plan(kind, (name, x, y),
+                      lambda place: self.compile_sigil(ops, x, y))
+    path_cache.replay(self.ctx, steps, self.use_random_gradient)
+
   def draw_CR_sigil(self, C=False, R=False):
     self.ctx.save()
     self.use_random_gradient()
-    self.ctx.set_line_width(int(self.LINE_WIDTH // 10) | 1)
+    self.ctx.set_line_width(int(self.state.LINE_WIDTH // 10) | 1)
     x, y = self.coords["C/R"]
     self.ctx.new_sub_path()
     self.ctx.translate(self.cursor_x, self.cursor_y)
-    self.ctx.scale(self.x_scaled, self.y_scaled)
-    self.ctx.set_line_width(self.LINE_WIDTH / self.x_scaled * 0.75)
+    self.ctx.scale(self.state.x_scaled, self.state.y_scaled)
+    self.ctx.set_line_width(self.state.LINE_WIDTH / self.state.x_scaled * 0.75)
     self.ctx.arc(x, y, self.big_r, -pi/2, pi/2)
     self.ctx.restore()
     self.ctx.save()
-    self.ctx.set_line_width(int(self.LINE_WIDTH // 10) | 1)
-    r,g,b = random.choice(self.palette)
+    self.ctx.set_line_width(int(self.state.LINE_WIDTH // 10) | 1)
+    r,g,b = self.rng.choice(self.palette)
     self.ctx.set_source_rgb(r, g, b)
     offset = self.big_r/2
     self.curve_to(x + 2*offset, y + offset, x - 2*offset, y - offset, x, y - self.big_r)
@@ -475,16 +550,16 @@ class SigilWriter:
 
     self.ctx.save()
     self.use_random_gradient()
-    self.ctx.set_line_width(int(self.LINE_WIDTH // 10) | 1)
+    self.ctx.set_line_width(int(self.state.LINE_WIDTH // 10) | 1)
     self.ctx.new_sub_path()
     self.ctx.translate(self.cursor_x, self.cursor_y)
-    self.ctx.scale(self.x_scaled, self.y_scaled)
-    self.ctx.set_line_width(self.LINE_WIDTH / self.x_scaled * 0.75)
+    self.ctx.scale(self.state.x_scaled, self.state.y_scaled)
+    self.ctx.set_line_width(self.state.LINE_WIDTH / self.state.x_scaled * 0.75)
     self.ctx.arc_negative(x, y, self.big_r, -pi/2, pi/2)
     self.ctx.restore()
     self.ctx.save()
-    self.ctx.set_line_width(int(self.LINE_WIDTH // 10) | 1)
-    r,g,b = random.choice(self.palette)
+    self.ctx.set_line_width(int(self.state.LINE_WIDTH // 10) | 1)
+    r,g,b = self.rng.choice(self.palette)
     self.ctx.set_source_rgb(r, g, b)
     offset = self.big_r/2
     self.curve_to(x + 2*offset, y + offset, x - 2*offset, y - offset, x, y - self.big_r)
@@ -495,91 +570,26 @@ class SigilWriter:
     self.ctx.restore()
   
   def write_name(self, name):
-    x_pos = int(self.writer.x_scaled + self.writer.XPAD)
+    x_pos = int(self.writer.state.x_scaled + self.writer.state.XPAD)
     self.writer.place_cursor(x_pos, 0)
     self.draw_sigil("NAME", name)
 
   def draw_shape(self, key, shape):
-    x, y = self.coords[key]
-
-    if shape in ["SQUARE", "D6"]:
-      x_off, y_off = self.x_y_from_angle(pi/4, self.small_r)
-      x_off -= self.small_r/10
-      y_off -= self.small_r/10
-      self.line(x+x_off, y+y_off, x-x_off, y+y_off)
-      self.line_to(x-x_off, y-y_off)
-      self.line_to(x+x_off, y-y_off)
-      self.line_to(x+x_off, y+y_off)
-      self.stroke()
-    elif shape == "CIRCLE":
-      rad = self.small_r * 5/7
-      self.arc(x,y,rad,0,2*pi) 
-    elif shape == "CONE":
-      x_base, y_base = self.x_y_from_angle(pi/2, self.small_r)
-      x_left, y_left = self.x_y_from_angle(5*pi/4, self.small_r)
-      x_right, y_right = self.x_y_from_angle(7*pi/4, self.small_r)
-      self.line(x + x_base, y + y_base, x + x_left, y + y_left)
-      self.line(x + x_base, y + y_base, x + x_right, y + y_right)
-      self.stroke()
-    elif shape == "SELF":
-      self.move_to(x, y-self.small_r/3)
-      self.curve_to(x+self.small_r/3, y-self.small_r*1.25, x+self.small_r*1.5, y, x, y+self.small_r*0.8) 
-      self.move_to(x, y-self.small_r/3)
-      self.curve_to(x-self.small_r/3, y-self.small_r*1.25, x-self.small_r*1.5, y, x, y+self.small_r*0.8) 
-      self.stroke()
-    elif shape == "CREATURE":
-      self.move_to(x, y+self.small_r/3)
-      self.curve_to(x+self.small_r/3, y+self.small_r*1.25, x+self.small_r*1.5, y, x, y-self.small_r*0.8) 
-      self.move_to(x, y+self.small_r/3)
-      self.curve_to(x-self.small_r/3, y+self.small_r*1.25, x-self.small_r*1.5, y, x, y-self.small_r*0.8) 
-      self.stroke() 
-    elif shape == "D4":
-      offset = self.small_r/10
-      x1, y1 = self.x_y_from_angle(pi/6, self.small_r)
-      x2, y2 = self.x_y_from_angle(5*pi/6, self.small_r)
-      self.line(x, y-self.small_r + offset, x+x1-offset, y+y1-offset)
-      self.line_to(x+x2+offset, y+y2-offset)
-      self.line_to(x, y-self.small_r + offset)
-      self.stroke()
-    elif shape == "D8":
-      offset = self.small_r*9/10
-      self.line(x, y - offset, x + offset, y)
-      self.line_to(x, y + offset)
-      self.line_to(x - offset, y)
-      self.line_to(x, y - offset)  
-      self.stroke()
-    elif shape == "D10":
-      offset = self.small_r/10
-      x1, y1 = self.x_y_from_angle(pi/6, self.small_r)
-      x2, y2 = self.x_y_from_angle(5*pi/6, self.small_r)
-      self.line(x, y-self.small_r + offset, x+x1-offset, y+y1-offset)
-      self.line_to(x,y+self.small_r - offset)
-      self.line_to(x+x2+offset, y+y2-offset)
-      self.line_to(x, y-self.small_r + offset)
-      self.stroke() 
-    elif shape == "D12":
-      rad = self.small_r*0.8
-      inc = 2 * pi / 5
-      start = pi/2
-      for i in range(1, 6):
-        if (i == 1):
-          xo, yo = self.x_y_from_angle(start, rad)
-          self.move_to(x+xo, y+yo)
-        xo, yo = self.x_y_from_angle(start + inc*i, rad)
-        self.line_to(x+xo, y+yo)
-      self.stroke()
+    self.draw_library_sigil(key, "shape", sigils.SHAPE_SIGILS, shape)
 
   def draw_components(self, vsm):
+    # the rings share one source and pen, so they are stroked together
     rad = 2*self.big_r - self.small_r
     if "M" in vsm:
       x,y = self.coords["LEVEL"]
-      self.arc(x,y,rad,0, 2*pi)
+      self.add_arc(x,y,rad,0, 2*pi)
     if "S" in vsm:
       x,y = self.coords["C/R"]
-      self.arc(x,y,rad,0, 2*pi)
+      self.add_arc(x,y,rad,0, 2*pi)
     if "V" in vsm:
       x,y = self.coords["CASTINGTIME"]
-      self.arc(x,y,rad,0, 2*pi)
+      self.add_arc(x,y,rad,0, 2*pi)
+    self.stroke_arcs()
 
 
   def draw_sigil(self, key, sigils):
@@ -594,36 +604,41 @@ class SigilWriter:
         scale_shift *= self.big_r / self.small_r
     else:
       scale_shift=0.5
-    self.writer.process_scale(scale_shift)
-    self.ctx.set_line_width(self.writer.LINE_WIDTH)
+    writer = self.writer.scaled(scale_shift)
+    self.ctx.set_line_width(writer.state.LINE_WIDTH)
     if len(insc) > 1:
-      x_offset = (self.writer.x_scaled + self.writer.XPAD) / 2 * (len(insc)-1)
+      x_offset = (writer.state.x_scaled + writer.state.XPAD) / 2 * (len(insc)-1)
     else:
       x_offset = 0
-    y_offset = self.writer.y_scaled / 2
+    y_offset = writer.state.y_scaled / 2
     if not name:
-      self.writer.place_cursor(self.rel_to_user_x(x) - x_offset, self.rel_to_user_y(y) - y_offset)
-    self.writer.write_inscription(insc)
-    self.writer.process_scale(1 / scale_shift)
+      writer.place_cursor(self.rel_to_user_x(x) - x_offset, self.rel_to_user_y(y) - y_offset)
+    writer.write_inscription(insc)
     self.ctx.restore()
 
   def use_random_gradient(self, num_stops=10, radial=True):
+    if self.draft:
+      # a pattern rather than set_source_rgb, so compiled plans keep asking
+      # for a colour on replay instead of baking one in
+      r, g, b = self.rng.choice(self.palette)
+      self.ctx.set_source(cairo.SolidPattern(r, g, b))
+      return
     if radial:
       pat = cairo.RadialGradient(self.cursor_x, self.cursor_y, 0.0, self.cursor_x, self.cursor_y, max(self.pixel_width, self.pixel_height)/2)
     else:
-      x,y = random.choice([(0,self.pixel_height), 
+      x,y = self.rng.choice([(0,self.pixel_height), 
                            (self.pixel_width, self.pixel_height),
                            (self.pixel_width, 0)])
       pat = cairo.LinearGradient(0.0, 0.0, x, y)
 
     for i in range(num_stops):
-      r, g, b = random.choice(self.palette)
+      r, g, b = self.rng.choice(self.palette)
       pat.add_color_stop_rgb(1/num_stops * i, r, g, b)
 
     self.ctx.set_source(pat)
   
   def use_random_solid_color(self):
-    r,g,b = random.choice(self.palette)
+    r,g,b = self.rng.choice(self.palette)
     self.ctx.set_source_rgb(r,g,b)
 
   def load_palette(self, palette_str, overwrite=True):
@@ -634,50 +649,113 @@ class SigilWriter:
         palette.append(color)
     self.palette = palette
   
-  def draw_spell_from_dict(self, spell_dict):
-    if "PALETTE" in spell_dict:
-      self.load_palette(spell_dict["PALETTE"])
-    self.write_name(spell_dict["NAME"])
+  def draw_spell_from_dict(self, spell):
+    spell = spells.as_record(spell)
+    spell.check()
+    if "PALETTE" in spell:
+      self.load_palette(spell["PALETTE"])
+    self.write_name(spell["NAME"])
     self.use_random_gradient()
-    self.draw_type[spell_dict["SAVE"]]()
-    self.LINE_WIDTH /= 2
-    self.ctx.set_line_width(self.LINE_WIDTH)
-    if "TARGETSHAPE" in spell_dict:
+    self.draw_frame(spell["SAVE"])
+    self.state = self.state.with_line_width(self.state.LINE_WIDTH / 2)
+    self.ctx.set_line_width(self.state.LINE_WIDTH)
+    if "TARGETSHAPE" in spell:
       self.use_random_gradient(radial=False)
-      self.draw_shape("TARGET", spell_dict["TARGETSHAPE"])
-    if "DAMAGEDICE" in spell_dict:
+      self.draw_shape("TARGET", spell["TARGETSHAPE"])
+    if "DAMAGEDICE" in spell:
       self.use_random_gradient(radial=False)
-      self.draw_shape("DAMAGE", spell_dict["DAMAGEDICE"])
+      self.draw_shape("DAMAGE", spell["DAMAGEDICE"])
     for key in ["LEVEL", "RANGE", "DAMAGE", "CASTINGTIME", "DURATION", "TARGET"]:
-      self.draw_sigil(key, spell_dict[key])
-    c = "C" in spell_dict["C/R"]
-    r = "R" in spell_dict["C/R"]
+      self.draw_sigil(key, spell[key])
+    c = "C" in spell["C/R"]
+    r = "R" in spell["C/R"]
     self.draw_CR_sigil(C=c, R=r)
     self.use_random_gradient(radial=False)
-    self.draw_school_sigil(spell_dict["SCHOOL"])
+    self.draw_school_sigil(spell["SCHOOL"])
     
     self.use_random_gradient()
-    self.draw_components(spell_dict["COMPONENTS"])
+    self.draw_components(spell["COMPONENTS"])
 
-  def parse_dir(self, indir="src", outdir="out"):
+  def parse_dir(self, indir="src", outdir="out", jobs=1, store=None):
+    # every card is drawn unless an OutputStore is given to share renders
+    renders = []
     for filename in os.scandir(indir):
       if filename.is_file() and filename.name.endswith(".spl"):
         outname = filename.name.split('.')[0] + ".png"
-        name = " ".join(filename.name.split('.')[0].split("_"))
-        print(name)
-        spell_dict = {}
-        spell_dict["NAME"] = name
-        with open(filename.path, "r") as infile:
-          parser = csv.reader(infile, delimiter=":")
-          for row in parser:
-            if len(row) == 2:
-              spell_dict[row[0]] = row[1]
-        self.draw_spell_from_dict(spell_dict)
-        self.export_image(outdir + "/" +spell_dict["LEVEL"] + "_" + outname)
-        self.LINE_WIDTH *= 2
-        self.ctx.set_line_width(self.LINE_WIDTH)
-        self.generate_default_context()
-    
+        spell_dict = spells.read_spl(filename.path)
+        print(spell_dict["NAME"])
+        renders.append((spell_dict, outdir + "/" + spell_dict["LEVEL"] + "_" + outname))
+    render_spells(renders, self.state.scale, jobs=jobs, store=store)
+
+
+def render_stream(renders, scale=2, jobs=1, store=None, window=None,
+                  indexed=False, draft=False):
+  # renders may be a generator; each card is reported as
+  # (spell, filename, error) in the order renders gave it, with at most a
+  # window of cards held at once (see cost.in_order)
+  render = render_spell if store is None else store.render
+  for (spell_dict, filename), error in cost.in_order(
+      renders,
+      lambda job: render(job[0], job[1], scale, indexed=indexed, draft=draft),
+      lambda job: cost.spell_cost(job[0], scale), jobs, window):
+    yield spell_dict, filename, error
+
+
+# bump whenever a change to the drawing code changes what a card looks like,
+# so stored renders from older code are not reused
+RENDERER_VERSION = 3
+
+
+@functools.lru_cache(maxsize=64)
+def palette_gradient(x, y, radius, palette):
+  pat = cairo.RadialGradient(x, y, 0.0, x, y, radius)
+  # add_color_stop_rbga(offset, % red, % green, % blue, % opacity)
+  num_stops = len(palette)*2
+  for i in range(num_stops):
+    r, g, b = palette[i%len(palette)]
+    pat.add_color_stop_rgb(1/num_stops * i, r, g, b)
+  return pat
+
+
+def render_spell(spell_dict, filename, scale=2, seed=None, indexed=False,
+                 draft=False):
+  # every card gets its own writer, surface and random stream so cards can
+  # be drawn from several threads at once
+  with surfaces.render():
+    scribe = SigilWriter(scale, seed=seed, record=filename.endswith(".pdf"),
+                         draft=draft,
+                         display_list=filename.endswith(DL.EXTENSIONS))
+    scribe.draw_spell_from_dict(spell_dict)
+    scribe.export_image(filename, indexed=indexed)
+  return filename
+
+
+def render_spell_sizes(spell_dict, filenames, seed=None):
+  # filenames maps each output scale to a path; the card geometry is built
+  # once at the largest scale and replayed for every size. The recording
+  # holds no pixels and each size is written before the next is rasterized,
+  # so the budget applies to one size at a time rather than the whole set
+  scribe = SigilWriter(max(filenames), seed=seed, record=True)
+  scribe.draw_spell_from_dict(spell_dict)
+  scribe.export_images(filenames)
+  return list(filenames.values())
+
+
+def render_spells(renders, scale=2, jobs=1, store=None):
+  render = render_spell if store is None else store.render
+  if jobs == 1:
+    return [render(spell_dict, filename, scale) for spell_dict, filename in renders]
+  # longest cards first, results back in the order they were asked for
+  renders = list(renders)
+  results = [None] * len(renders)
+  with ThreadPoolExecutor(max_workers=jobs) as pool:
+    futures = [(i, pool.submit(render, spell_dict, filename, scale))
+               for _, i, (spell_dict, filename) in cost.longest_first(
+                 renders, lambda job: cost.spell_cost(job[0], scale))]
+    for i, future in futures:
+      results[i] = future.result()
+  return results
+
 
 def main():
 
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+import csv
+import mmap
+import os
+import string
+import sys
+import sigils
+
+FIELDS = ("NAME", "LEVEL", "SCHOOL", "RITUAL", "CASTINGTIME", "COMPONENTS",
+          "CONCENTRATION", "DAMAGE", "DAMAGEDICE", "DURATION", "TARGET",
+          "TARGETSHAPE", "SAVE", "RANGE", "PALETTE", "C/R")
+ATTRS = {field: field.replace("/", "").lower() for field in FIELDS}
+
+# columns with a handful of distinct values share one string object per value
+INTERNED = {"LEVEL", "SCHOOL", "RITUAL", "CASTINGTIME", "COMPONENTS",
+            "CONCENTRATION", "DAMAGEDICE", "DURATION", "TARGETSHAPE", "SAVE",
+            "C/R"}
+
+SAVES = ("NOSAVE", "ATTACK", "STR", "DEX", "CON", "INT", "WIS", "CHA")
+SCHOOLS = tuple(sigils.SCHOOL_SIGILS)
+SHAPES = tuple(sigils.SHAPE_SIGILS)
+
+# fields draw_spell_from_dict cannot do without
+REQUIRED = ("NAME", "LEVEL", "SCHOOL", "CASTINGTIME", "COMPONENTS", "DAMAGE",
+            "DURATION", "TARGET", "SAVE", "RANGE", "C/R")
+
+
+class InvalidSpell(ValueError):
+  pass
+
+
+# One spell, stored in slots rather than a dict. Supports the dict style
+# access the loaders and renderer have always used (spell["SAVE"],
+# "PALETTE" in spell, spell.get(...)), where a field that was never given
+# counts as missing. Problems are found when the record is built or
+# edited, and kept in errors.
+class SpellRecord:
+  __slots__ = tuple(ATTRS.values()) + ("extra", "errors")
+
+  def __init__(self, values):
+    self.extra = None
+    for attr in ATTRS.values():
+      setattr(self, attr, None)
+    for key, value in values.items():
+      self.set_field(key, value)
+    if self.cr is None and (self.concentration is not None or
+                            self.ritual is not None):
+      c = "C" if self.concentration == "yes" else ""
+      r = "R" if self.ritual == "yes" else ""
+      self.cr = sys.intern(c+r)
+    self.errors = self.validate()
+
+  @classmethod
+  def restored(cls, items, errors):
+    # a record saved by catalogue.compiled(), already validated when it was
+    # first built
+    record = cls.__new__(cls)
+    record.extra = None
+    for attr in ATTRS.values():
+      setattr(record, attr, None)
+    for key, value in items:
+      record.set_field(key, value)
+    record.errors = tuple(errors)
+    return record
+
+  def set_field(self, key, value):
+    if key not in ATTRS:
+      if self.extra is None:
+        self.extra = {}
+      self.extra[key] = value
+    elif value is not None and key in INTERNED:
+      setattr(self, ATTRS[key], sys.intern(value))
+    else:
+      setattr(self, ATTRS[key], value)
+
+  def validate(self):
+    errors = []
+    for field in REQUIRED:
+      if field not in self:
+        errors.append(field + " is missing")
+    if self.save is not None and self.save not in SAVES:
+      errors.append("SAVE must be one of " + ", ".join(SAVES))
+    if self.palette is not None:
+      colors = [color for color in self.palette.split("#") if len(color) == 6]
+      if not colors:
+        errors.append("PALETTE has no colours")
+      elif not all(c in string.hexdigits for color in colors for c in color):
+        errors.append("PALETTE has a malformed colour")
+    return tuple(errors)
+
+  def check(self):
+    if self.errors:
+      raise InvalidSpell((self.name or "spell") + ": " + "; ".join(self.errors))
+
+  def __getitem__(self, key):
+    if key in ATTRS:
+      value = getattr(self, ATTRS[key])
+      if value is not None:
+        return value
+    elif self.extra is not None and key in self.extra:
+      return self.extra[key]
+    raise KeyError(key)
+
+  def __setitem__(self, key, value):
+    self.set_field(key, value)
+    self.errors = self.validate()
+
+  def __contains__(self, key):
+    if key in ATTRS:
+      return getattr(self, ATTRS[key]) is not None
+    return self.extra is not None and key in self.extra
+
+  def get(self, key, default=None):
+    if key in self:
+      return self[key]
+    return default
+
+  def keys(self):
+    keys = [field for field in FIELDS if field in self]
+    if self.extra is not None:
+      keys.extend(self.extra)
+    return keys
+
+  def items(self):
+    return [(key, self[key]) for key in self.keys()]
+
+  def __iter__(self):
+    return iter(self.keys())
+
+  def __eq__(self, other):
+    if not isinstance(other, SpellRecord):
+      return NotImplemented
+    return self.items() == other.items()
+
+  __hash__ = None
+
+  def __repr__(self):
+    return "SpellRecord(" + repr(dict(self.items())) + ")"
+
+
+def as_record(spell):
+  if isinstance(spell, SpellRecord):
+    return spell
+  return SpellRecord(spell)
+
+
+def file_stem(name):
+  # the reverse of read_spl's naming: blanks become underscores, and so
+  # does anything else that could not stand in a file name
+  return "".join(c if c.isalnum() or c in "-_" else "_"
+                 for c in "_".join(name.split()))
+
+
+def read_spl(path):
+  name = " ".join(os.path.basename(path).split('.')[0].split("_"))
+  spell_dict = {}
+  spell_dict["NAME"] = name
+  with open(path, "r") as infile:
+    parser = csv.reader(infile, delimiter=":")
+    for row in parser:
+      if len(row) == 2:
+        spell_dict[row[0]] = row[1]
+  return SpellRecord(spell_dict)
+
+
+def csv_lines(path, use_mmap=False):
+  if path == "-":
+    yield from sys.stdin
+  elif use_mmap:
+    with open(path, "rb") as db:
+      with mmap.mmap(db.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        for line in iter(view.readline, b""):
+          yield line.decode("utf-8")
+  else:
+    with open(path, "r") as db:
+      yield from db
+
+
+def open_csv(path, use_mmap=False):
+  # returns the header titles and a generator of records, so a catalogue
+  # of any size is read one row at a time
+  lines = csv_lines(path, use_mmap)
+  headers = [title.strip() for title in next(lines).split(",")]
+
+  def records():
+    for spell_line in lines:
+      if not spell_line.strip():
+        continue
+      # a short row leaves its last fields missing, so validate() reports
+      # it and the renderer fails that card instead of the whole run
+      values = spell_line.split(",")
+      yield SpellRecord({header: value.strip()
+                         for header, value in zip(headers, values)})
+  return headers, records()
+
+
+def read_csv(path):
+  headers, records = open_csv(path)
+  return headers, {spell["NAME"]: spell for spell in records}
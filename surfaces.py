@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+import contextlib
+import functools
+import sys
+import threading
+import tracemalloc
+import warnings
+import cairo
+
+try:
+  import resource
+except ImportError:
+  resource = None
+
+# bytes the image surfaces of one render (a card or a document) may take
+# together; None leaves renders unchecked
+MEMORY_BUDGET = None
+REFUSE_OVER_BUDGET = True
+
+# draft renders are drawn at DRAFT_SCALE of the scale asked for, with one of
+# these antialias modes (True means "fast")
+DRAFT_SCALE = 0.5
+DRAFT_ANTIALIAS = {"fast": cairo.ANTIALIAS_FAST, "none": cairo.ANTIALIAS_NONE}
+
+trackers = []
+trackers_lock = threading.Lock()
+# surface bytes of the render running on each thread
+local = threading.local()
+
+
+class MemoryBudgetExceeded(MemoryError):
+  pass
+
+
+def set_memory_budget(budget, refuse=True):
+  global MEMORY_BUDGET, REFUSE_OVER_BUDGET
+  MEMORY_BUDGET = budget
+  REFUSE_OVER_BUDGET = refuse
+
+
+def draft_antialias(draft):
+  return DRAFT_ANTIALIAS["fast" if draft is True else draft]
+
+
+def surface_bytes(width, height, fmt=cairo.FORMAT_ARGB32):
+  return cairo.ImageSurface.format_stride_for_width(fmt, int(width)) * int(height)
+
+
+def account(width, height, fmt=cairo.FORMAT_ARGB32):
+  # called before every image surface is created, so a render that would
+  # go over budget is refused before cairo allocates anything
+  size = surface_bytes(width, height, fmt)
+  rendered = getattr(local, "render_bytes", None)
+  total = size if rendered is None else rendered + size
+  if MEMORY_BUDGET is not None and total > MEMORY_BUDGET:
+    message = "%dx%d surface needs %d bytes" % (width, height, size)
+    if rendered:
+      message += ", %d with the render's other surfaces" % total
+    message += ", over the %d byte budget" % MEMORY_BUDGET
+    if REFUSE_OVER_BUDGET:
+      raise MemoryBudgetExceeded(message)
+    warnings.warn(message, ResourceWarning)
+  if rendered is not None:
+    local.render_bytes = total
+  with trackers_lock:
+    for tracker in trackers:
+      tracker.add(size)
+  return size
+
+
+@contextlib.contextmanager
+def render():
+  # one card or document. Its writer keeps the canvas, recordings and
+  # rasterized copies alive until it is done, so every surface created
+  # inside counts toward MEMORY_BUDGET until the render ends; a render
+  # opened inside another is part of it
+  if getattr(local, "render_bytes", None) is not None:
+    yield
+    return
+  local.render_bytes = 0
+  try:
+    yield
+  finally:
+    local.render_bytes = None
+
+
+def peak_rss():
+  if resource is None:
+    return None
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # kilobytes on linux, bytes on macos
+  return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Opt-in accounting for a card, a document or a whole batch. While active
+# it counts every image surface created in the process, and on exit it
+# records the tracemalloc peak, the largest allocation sites and peak RSS.
+# All three are process wide: with several render threads the figures
+# cover every card in flight, not just the one the tracker was opened for.
+# Trackers nest: one opened inside another resets the tracemalloc peak only
+# after handing the peak so far to every open tracker, which report the
+# largest peak they saw.
+class MemoryTracker:
+  def __init__(self, label="", trace=True, top=5):
+    self.label = label
+    self.trace = trace
+    self.top = top
+    self.surfaces = 0
+    self.surface_bytes = 0
+    self.largest_surface = 0
+    self.traced_baseline = None
+    self.traced_peak = None
+    self.top_allocations = []
+    self.rss_peak = None
+    self.started_tracing = False
+
+  def add(self, size):
+    self.surfaces += 1
+    self.surface_bytes += size
+    self.largest_surface = max(self.largest_surface, size)
+
+  def seen(self, peak):
+    if self.trace:
+      self.traced_peak = max(self.traced_peak or 0, peak)
+
+  def __enter__(self):
+    with trackers_lock:
+      if self.trace:
+        if not tracemalloc.is_tracing():
+          tracemalloc.start()
+          self.started_tracing = True
+        else:
+          reset_traced_peak()
+        self.traced_baseline = tracemalloc.get_traced_memory()[0]
+      trackers.append(self)
+    return self
+
+  def __exit__(self, *exc):
+    with trackers_lock:
+      trackers.remove(self)
+      if self.trace:
+        self.seen(tracemalloc.get_traced_memory()[1])
+        stats = tracemalloc.take_snapshot().statistics("lineno")[:self.top]
+        self.top_allocations = [str(stat) for stat in stats]
+        if self.started_tracing and not any(t.trace for t in trackers):
+          tracemalloc.stop()
+    self.rss_peak = peak_rss()
+    return False
+
+  def report(self):
+    return {"label": self.label,
+            "surfaces": self.surfaces,
+            "surface_bytes": self.surface_bytes,
+            "largest_surface": self.largest_surface,
+            "traced_baseline": self.traced_baseline,
+            "traced_peak": self.traced_peak,
+            "top_allocations": self.top_allocations,
+            "rss_peak": self.rss_peak}
+
+
+def reset_traced_peak():
+  # called under trackers_lock
+  peak = tracemalloc.get_traced_memory()[1]
+  for tracker in trackers:
+    tracker.seen(peak)
+  if hasattr(tracemalloc, "reset_peak"):
+    tracemalloc.reset_peak()
+  elif not any(tracker.trace for tracker in trackers):
+    # python 3.8 has no reset_peak, and restarting forgets the blocks traced
+    # so far, so that is only done with no other tracker tracing; a nested
+    # tracker there reports the peak since the outer one opened
+    tracemalloc.stop()
+    tracemalloc.start()
+
+
+def new_surface(width, height, record=False):
+  if record:
+    extents = cairo.Rectangle(0, 0, width, height)
+    return cairo.RecordingSurface(cairo.CONTENT_COLOR_ALPHA, extents)
+  account(width, height)
+  return cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+
+
+# one template per card layout; only fixed size card canvases are cached,
+# since text pages and sheets change size with their contents
+@functools.lru_cache(maxsize=4)
+def background_template(state, width, height, rgb):
+  account(width, height)
+  surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+  fill(surface, width, height, rgb)
+  surface.flush()
+  return surface
+
+
+def fill(surface, width, height, rgb):
+  ctx = cairo.Context(surface)
+  ctx.set_source_rgb(*rgb)
+  ctx.rectangle(0, 0, width, height)
+  ctx.fill()
+
+
+def new_filled_surface(width, height, rgb, record=False, state=None):
+  # cards repeat the same canvas for every RenderState, so given one the
+  # filled pixels are copied from a cached template; anything else is
+  # filled directly
+  surface = new_surface(width, height, record=record)
+  if record or state is None:
+    fill(surface, width, height, rgb)
+  else:
+    # the template is held while its pixels are copied, since not every
+    # cairo binding ties the data buffer's lifetime to its surface
+    template = background_template(state, width, height, tuple(rgb))
+    surface.get_data()[:] = template.get_data()
+    surface.mark_dirty()
+  return surface
+
+
+def replay(recording, factor, width, height):
+  # paints a recording back through a scale, so cairo re-rasterizes the
+  # recorded vector operations at the new resolution instead of resampling
+  account(width, height)
+  surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+  ctx = cairo.Context(surface)
+  ctx.scale(factor, factor)
+  ctx.set_source_surface(recording, 0, 0)
+  ctx.paint()
+  return surface
+
+
+def write_pdf(recording, filename, width, height):
+  # recordings keep their vector operations, so a PDF copy stays sharp at
+  # any zoom instead of embedding a bitmap
+  surface = cairo.PDFSurface(filename, width, height)
+  ctx = cairo.Context(surface)
+  ctx.set_source_surface(recording, 0, 0)
+  ctx.paint()
+  surface.finish()
@@ -0,0 +1,81 @@
+import itertools
+import catalogue
+import spells
+
+
+def records(*rows):
+  return [spells.SpellRecord(row) for row in rows]
+
+
+def names(selected):
+  return [record["NAME"] for record in selected]
+
+
+LEVELS = records({"NAME": "Light", "LEVEL": "0", "SCHOOL": "Evocation"},
+                 {"NAME": "Sleep", "LEVEL": "1", "SCHOOL": "ENCHANTMENT"},
+                 {"NAME": "Fireball", "LEVEL": "3", "SCHOOL": "EVOCATION"},
+                 {"NAME": "Wish", "LEVEL": "9", "SCHOOL": "CONJURATION"},
+                 {"NAME": "Legend", "LEVEL": "10"},
+                 {"NAME": "Oddity", "LEVEL": "varies", "SCHOOL": "EVOCATION"})
+
+
+def test_eq_and_ne_ignore_case():
+  index = catalogue.Catalogue(LEVELS)
+  assert names(index.query(("SCHOOL", "eq", "evocation"))) == [
+    "Light", "Fireball", "Oddity"]
+  assert names(index.query(school__ne="EVOCATION")) == ["Sleep", "Wish", "Legend"]
+  assert names(index.query(("SCHOOL", "in", ("conjuration", "enchantment")))) == [
+    "Sleep", "Wish"]
+
+
+def test_numeric_ops_compare_numbers_and_skip_text():
+  index = catalogue.Catalogue(LEVELS)
+  assert names(index.query(level__lt=3)) == ["Light", "Sleep"]
+  assert names(index.query(level__le=3)) == ["Light", "Sleep", "Fireball"]
+  assert names(index.query(level__gt=3)) == ["Wish", "Legend"]
+  assert names(index.query(level__ge="9")) == ["Wish", "Legend"]
+  assert names(index.query(("LEVEL", "gt", 3), ("SCHOOL", "eq", ""))) == ["Legend"]
+
+
+def test_bitmap_and_scan_paths_agree():
+  count = catalogue.LOW_CARDINALITY * 3
+  index = catalogue.Catalogue(records(*({"NAME": "Spell %d" % i,
+                                         "LEVEL": str(i % 10),
+                                         "RANGE": str(i % (count // 2))}
+                                        for i in range(count))))
+  low = index.column("LEVEL")
+  high = index.column("RANGE")
+  assert len(low.categories) <= catalogue.LOW_CARDINALITY < len(high.categories)
+  for field, column in (("LEVEL", low), ("RANGE", high)):
+    for op, value in (("eq", "7"), ("ne", "7"), ("in", ("3", "70")),
+                      ("lt", 5), ("ge", 8)):
+      expected = {row for row, record in enumerate(index.records)
+                  if catalogue.matches(record, [(field, op, value)])}
+      assert set(catalogue.members(column.where(op, value, index.all_rows))) == expected
+  assert low.bitmaps is not None
+  assert high.bitmaps is None
+
+
+def test_sort_ranks_numbers_before_text():
+  index = catalogue.Catalogue(LEVELS)
+  assert names(index.query(sort="LEVEL")) == [
+    "Light", "Sleep", "Fireball", "Wish", "Legend", "Oddity"]
+  assert names(index.query(sort=("SCHOOL", "LEVEL"))) == [
+    "Legend", "Wish", "Sleep", "Fireball", "Oddity", "Light"]
+  assert names(index.query(level__le=3, sort="LEVEL", reverse=True)) == [
+    "Fireball", "Sleep", "Light"]
+
+
+def test_matches_agrees_with_where():
+  index = catalogue.Catalogue(LEVELS)
+  values = ("0", "3", "10", "evocation", "varies", "", ("1", "EVOCATION"))
+  for field, op, value in itertools.product(("LEVEL", "SCHOOL"),
+                                            catalogue.OPERATORS, values):
+    if op in catalogue.COMPARE and catalogue.to_number(value) is None:
+      continue
+    if (op == "in") != isinstance(value, tuple):
+      continue
+    conditions = [(field, op, value)]
+    expected = [record for record in index.records
+                if catalogue.matches(record, conditions)]
+    assert index.query(*conditions) == expected, conditions
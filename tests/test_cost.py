@@ -0,0 +1,49 @@
+import threading
+import time
+import cost
+
+
+def test_longest_first_orders_by_cost_and_keeps_ties_in_order():
+  jobs = ["b", "aaa", "c", "dd", "e"]
+  assert cost.longest_first(jobs, len) == [
+    (3, 1, "aaa"), (2, 3, "dd"), (1, 0, "b"), (1, 2, "c"), (1, 4, "e")]
+  assert cost.longest_first([], len) == []
+
+
+def test_in_order_reports_jobs_in_the_order_given():
+  # later jobs are cheaper to run but estimated dearer, so they are
+  # submitted and finish first; reports still follow the input
+  jobs = list(range(12))
+
+  def run(job):
+    time.sleep((12 - job) / 1000)
+    if job % 5 == 3:
+      raise ValueError(job)
+
+  for workers in (1, 3):
+    results = list(cost.in_order(iter(jobs), run, lambda job: job, workers,
+                                 window=4))
+    assert [job for job, error in results] == jobs
+    assert [job for job, error in results if error is not None] == [3, 8]
+    assert all(isinstance(error, ValueError) and error.args == (job,)
+               for job, error in results if error is not None)
+
+
+def test_in_order_reads_at_most_two_windows_ahead():
+  read = []
+  started = []
+  lock = threading.Lock()
+
+  def jobs():
+    for job in range(20):
+      read.append(job)
+      yield job
+
+  def run(job):
+    with lock:
+      started.append(job)
+
+  for job, error in cost.in_order(jobs(), run, lambda job: -job, 2, window=3):
+    assert error is None
+    assert len(read) - job <= 2 * 3
+  assert sorted(started) == list(range(20))
@@ -0,0 +1,121 @@
+import json
+import math
+import display_list as DL
+
+
+def stroked(draw, cap=0):
+  dl = DL.DisplayList(100, 100)
+  dl.set_line_cap(cap)
+  draw(dl)
+  dl.stroke()
+  return dl
+
+
+def test_optimize_merges_moves_and_collinear_lines():
+  def draw(dl):
+    dl.move_to(0, 0)
+    dl.move_to(10, 10)
+    dl.line_to(20, 10)
+    dl.line_to(30, 10)
+    dl.line_to(30, 20)
+    dl.move_to(50, 50)
+  ops = DL.optimize(stroked(draw).ops)
+  assert ops[1:-1] == [DL.MoveTo(10, 10), DL.LineTo(30, 10), DL.LineTo(30, 20)]
+
+
+def test_optimize_keeps_lines_that_turn_back():
+  def draw(dl):
+    dl.move_to(0, 0)
+    dl.line_to(10, 0)
+    dl.line_to(5, 0)
+  ops = DL.optimize(stroked(draw).ops)
+  assert ops[1:-1] == [DL.MoveTo(0, 0), DL.LineTo(10, 0), DL.LineTo(5, 0)]
+
+
+def test_optimize_drops_lines_of_no_length():
+  def draw(dl):
+    dl.move_to(5, 5)
+    dl.line_to(5, 5)
+    dl.move_to(0, 0)
+    dl.line_to(10, 0)
+    dl.line_to(10, 0)
+    dl.close_path()
+    dl.line_to(0, 0)
+  ops = DL.optimize(stroked(draw).ops)
+  assert ops[1:-1] == [DL.MoveTo(0, 0), DL.LineTo(10, 0), DL.ClosePath()]
+  assert DL.optimize(stroked(lambda dl: (dl.move_to(5, 5), dl.line_to(5, 5))).ops) == []
+
+
+def test_optimize_keeps_dots_under_round_caps():
+  ops = DL.optimize(stroked(lambda dl: (dl.move_to(5, 5), dl.line_to(5, 5)),
+                            cap=1).ops)
+  assert ops[1:-1] == [DL.MoveTo(5, 5), DL.LineTo(5, 5)]
+
+
+def test_arc_from_its_start_adds_no_line():
+  dl = DL.DisplayList(100, 100)
+  dl.move_to(60, 50)
+  dl.arc(50, 50, 10, 0, math.pi)
+  assert [type(op) for op in dl.path] == [DL.MoveTo, DL.Arc]
+  dl.new_path()
+  dl.move_to(0, 0)
+  dl.arc(50, 50, 10, 0, math.pi)
+  assert [type(op) for op in dl.path] == [DL.MoveTo, DL.LineTo, DL.Arc]
+
+
+def test_optimize_joins_strokes_and_drops_repeated_sources():
+  dl = DL.DisplayList(100, 100)
+  for x in (10, 20):
+    dl.set_source_rgb(1, 0, 0)
+    dl.move_to(x, 0)
+    dl.line_to(x, 10)
+    dl.stroke()
+  dl.rectangle(0, 0, 5, 5)
+  dl.fill()
+  dl.move_to(0, 50)
+  dl.line_to(10, 50)
+  dl.close_path()
+  dl.stroke()
+  kinds = [type(op).__name__ for op in DL.optimize(dl.ops)]
+  assert kinds == ["SetSource", "MoveTo", "LineTo", "MoveTo", "LineTo", "Stroke",
+                   "MoveTo", "LineTo", "LineTo", "LineTo", "ClosePath", "Fill",
+                   "MoveTo", "LineTo", "ClosePath", "Stroke"]
+
+
+def test_json_round_trip():
+  dl = DL.DisplayList(120, 80, background=(0.1, 0.2, 0.3))
+  dl.set_source_rgb(0.5, 0.25, 1)
+  dl.scale(2, 3)
+  dl.move_to(1, 1)
+  dl.curve_to(2, 2, 3, 3, 4, 1)
+  dl.arc_negative(10, 10, 2, math.pi, 0)
+  dl.close_path()
+  dl.stroke()
+  dl.rectangle(0, 0, 5, 5)
+  dl.fill()
+  loaded = DL.DisplayList.from_json(json.loads(json.dumps(dl.to_json())))
+  assert loaded.ops == dl.ops
+  assert [type(op) for op in loaded.ops] == [type(op) for op in dl.ops]
+  assert (loaded.width, loaded.height, loaded.background) == (120, 80, (0.1, 0.2, 0.3))
+
+
+def test_svg_splits_arcs_into_half_turns():
+  circle = DL.Arc(0, 0, 10, 10, 0, 2 * math.pi, False)
+  assert DL.svg_arc(circle) == "A10 10 0 0 1 -10 0 A10 10 0 0 1 10 0"
+  three_quarters = DL.Arc(0, 0, 10, 10, 0, 1.5 * math.pi, False)
+  assert DL.svg_arc(three_quarters).count("A") == 2
+  half = DL.Arc(0, 0, 10, 5, 0, -math.pi, True)
+  assert DL.svg_arc(half) == "A10 5 0 0 0 -10 0"
+
+
+def test_svg_draws_elliptical_pens_through_a_scale():
+  dl = DL.DisplayList(100, 100)
+  dl.scale(2, 4)
+  dl.set_line_width(1)
+  dl.move_to(1, 1)
+  dl.line_to(5, 1)
+  dl.stroke()
+  svg = dl.to_svg()
+  assert '<g transform="scale(2 4)"><path d="M1 1 L5 1"' in svg
+  assert 'stroke-width="1"' in svg
+  assert 'stroke-miterlimit="10"' in svg
@@ -0,0 +1,72 @@
+import string
+import types
+import text_layout
+
+
+def writer():
+  state = types.SimpleNamespace(XPAD=1, YPAD=2, x_scaled=10, y_scaled=20)
+  return types.SimpleNamespace(runes=set(string.ascii_uppercase + " "),
+                               state=state)
+
+
+def lines(*texts):
+  return [list(text + "\n") for text in texts]
+
+
+def texts(rows):
+  return ["".join(row) for row in rows]
+
+
+def page_rows(page):
+  # the text of each row on a page, rebuilt from its glyph positions
+  rows = [""] * page.rows
+  for glyph in page.glyphs:
+    row = int((glyph.y - 2) / 22)
+    col = int((glyph.x - 6) / 11)
+    rows[row] = rows[row].ljust(col) + glyph.rune
+  return rows
+
+
+def test_long_words_are_split_at_the_column():
+  assert texts(text_layout.wrap(writer(), lines("ABCDEFGHIJ"), 4)) == [
+    "ABCD", "EFGH", "IJ"]
+  assert texts(text_layout.wrap(writer(), lines("AB ABCDEFGHIJ"), 4)) == [
+    "AB", "ABCD", "EFGH", "IJ"]
+
+
+def test_blank_lines_keep_their_row():
+  rows = text_layout.wrap(writer(), lines("AB", "", "  ", "CD"), 4)
+  assert texts(rows) == ["AB", "", "", "CD"]
+  assert text_layout.measure(writer(), lines("AB", "", "CD"), 4) == (2, 3)
+  page, = text_layout.layout(writer(), lines("AB", "", "CD"))
+  assert page_rows(page) == ["AB", "", "CD"]
+
+
+def test_rows_that_fit_exactly_are_not_wrapped():
+  assert texts(text_layout.wrap(writer(), lines("ABCD"), 4)) == ["ABCD"]
+  assert texts(text_layout.wrap(writer(), lines("AB CD"), 5)) == ["AB CD"]
+  assert texts(text_layout.wrap(writer(), lines("AB CD"), 4)) == ["AB", "CD"]
+  assert texts(text_layout.wrap(writer(), lines("ABC DEF"), 3)) == ["ABC", "DEF"]
+
+
+def test_last_page_holds_the_remaining_rows():
+  source = iter(lines("A", "B", "C", "D", "E"))
+  pages = list(text_layout.pages(writer(), source, columns=10, rows_per_page=2))
+  assert [page.rows for page in pages] == [2, 2, 1]
+  assert [page.columns for page in pages] == [10, 10, 10]
+  assert [page_rows(page) for page in pages] == [["A", "B"], ["C", "D"], ["E"]]
+
+
+def test_full_pages_add_no_empty_page():
+  pages = text_layout.layout(writer(), lines("A", "B", "C", "D"), 10,
+                             rows_per_page=2)
+  assert [page.rows for page in pages] == [2, 2]
+  empty, = text_layout.layout(writer(), [], 10, rows_per_page=2)
+  assert empty == text_layout.Page([], 10, 0)
+
+
+def test_alignment_shifts_rows_within_the_widest():
+  page, = text_layout.layout(writer(), lines("ABCD", "AB"), align="right")
+  assert page_rows(page) == ["ABCD", "  AB"]
+  page, = text_layout.layout(writer(), lines("ABCD", "AB"), align="center")
+  assert page_rows(page) == ["ABCD", " AB"]
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+import itertools
+from collections import namedtuple
+
+# x, y are the cursor position the rune is drawn from, exactly where
+# CharacterWriter.write_inscription would have placed its cursor
+Glyph = namedtuple("Glyph", ["rune", "x", "y"])
+Page = namedtuple("Page", ["glyphs", "columns", "rows"])
+
+# rune outline styles, numbered in this order by CharacterWriter.STYLES
+STYLES = ("curved", "diamond", "square", "hex1", "hex2", "chamfer", "octogon")
+
+
+def advances(writer, rune):
+  return rune != "\n" and (rune in writer.runes or rune.isnumeric())
+
+
+def row_of(writer, insc_line):
+  # the runes of a parsed line that take up a cell; trailing blanks are
+  # dropped since they draw nothing
+  row = [rune for rune in insc_line if advances(writer, rune)]
+  while row and row[-1] == " ":
+    row.pop()
+  return row
+
+
+def split_rows(writer, insc_lines):
+  return [row_of(writer, line) for line in insc_lines]
+
+
+def segments(row):
+  run = []
+  for rune in row:
+    if run and (rune == " ") != (run[-1] == " "):
+      yield run
+      run = []
+    run.append(rune)
+  if run:
+    yield run
+
+
+def wrap_row(row, columns):
+  if columns is None or len(row) <= columns:
+    return [row]
+  rows = []
+  current = []
+  for seg in segments(row):
+    if seg[0] == " ":
+      # blanks that would fill the row become the line break; leading
+      # indentation is only kept on the first row
+      if len(current) + len(seg) >= columns:
+        if current:
+          rows.append(current)
+        current = []
+      elif current or not rows:
+        current = current + seg
+      continue
+    if len(current) + len(seg) > columns:
+      while current and current[-1] == " ":
+        current.pop()
+      if current:
+        rows.append(current)
+      current = []
+    while len(seg) > columns:
+      rows.append(seg[:columns])
+      seg = seg[columns:]
+    current = current + seg
+  if current or not rows:
+    rows.append(current)
+  return rows
+
+
+def wrapped(writer, insc_lines, columns=None):
+  for line in insc_lines:
+    yield from wrap_row(row_of(writer, line), columns)
+
+
+def wrap(writer, insc_lines, columns=None):
+  return list(wrapped(writer, insc_lines, columns))
+
+
+def measure(writer, insc_lines, columns=None):
+  width = height = 0
+  for row in wrapped(writer, insc_lines, columns):
+    width = max(width, len(row))
+    height += 1
+  return width, height
+
+
+def pages(writer, insc_lines, columns=None, align="left", rows_per_page=None):
+  # a fixed page size (columns and rows_per_page) sets every page's width,
+  # so insc_lines is read once, as pages are asked for, and may be any
+  # iterator. Otherwise pages share the widest row, which is measured in a
+  # first pass over the lines. Either way only one page of rows is held
+  if columns is not None and rows_per_page is not None:
+    width = columns
+  else:
+    width, height = measure(writer, insc_lines, columns)
+    if align != "left" and columns is not None:
+      width = max(width, columns)
+    rows_per_page = rows_per_page or max(height, 1)
+  rows = wrapped(writer, insc_lines, columns)
+
+  state = writer.state
+  advance_x = state.XPAD + state.x_scaled
+  advance_y = state.YPAD + state.y_scaled
+  home_x = state.XPAD + state.x_scaled / 2
+  home_y = state.YPAD
+
+  page_rows = list(itertools.islice(rows, rows_per_page))
+  while True:
+    glyphs = []
+    for row_num, row in enumerate(page_rows):
+      if align == "center":
+        shift = (width - len(row)) / 2
+      elif align == "right":
+        shift = width - len(row)
+      else:
+        shift = 0
+      y = home_y + row_num * advance_y
+      for col, rune in enumerate(row):
+        if rune in ("", " "):
+          continue
+        glyphs.append(Glyph(rune, home_x + (shift + col) * advance_x, y))
+    yield Page(glyphs, width, len(page_rows))
+    page_rows = list(itertools.islice(rows, rows_per_page))
+    if not page_rows:
+      break
+
+
+def layout(writer, insc_lines, columns=None, align="left", rows_per_page=None):
+  return list(pages(writer, insc_lines, columns, align, rows_per_page))
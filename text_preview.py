@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+import os
+import time
+import cairo
+import character_writer as CW
+import surfaces
+import text_layout
+
+
+# Re-renders a text document one row at a time. Each distinct row is drawn
+# once into an alpha band, and the bands are masked onto the page through
+# the ink gradient. A band does not depend on where its row sits, so rows
+# that moved, or that repeat, are reused. Only rows whose text changed
+# are stroked again.
+class IncrementalRenderer:
+  def __init__(self, scale=1, style="curved", draft=False):
+    self.writer = CW.CharacterWriter(scale, draft=draft)
+    self.writer.style = self.writer.STYLES[style]
+    self.rows = {}
+    self.bands = {}
+    self.surface = None
+    self.dirty = []
+
+  def row_for(self, line):
+    if line not in self.rows:
+      insc = self.writer.parse_inscription(line)
+      self.rows[line] = tuple(text_layout.split_rows(self.writer, [insc])[0])
+    return self.rows[line]
+
+  def band_for(self, row):
+    # bands reach half a row past their own row so tall runes and numeric
+    # stacks are not clipped
+    state = self.writer.state
+    margin = (state.YPAD + state.y_scaled) / 2
+    if row not in self.bands:
+      width, height = self.writer.canvas_size(state, len(row), 1)
+      surfaces.account(width, int(height + 2 * margin), cairo.FORMAT_A8)
+      band = cairo.ImageSurface(cairo.FORMAT_A8, width, int(height + 2 * margin))
+      ctx = cairo.Context(band)
+      if self.writer.draft:
+        ctx.set_antialias(surfaces.draft_antialias(self.writer.draft))
+      ctx.set_line_width(state.LINE_WIDTH)
+      ctx.set_line_cap(cairo.LINE_CAP_ROUND)
+      ctx.translate(0, margin)
+      self.writer.ctx = ctx
+      self.writer.surface = band
+      self.writer.write_glyphs(text_layout.layout(self.writer, [row])[0].glyphs)
+      self.bands[row] = band
+    return self.bands[row], margin
+
+  def render(self, lines):
+    rows = [self.row_for(line) for line in lines]
+    self.dirty = [i for i, row in enumerate(rows) if row and row not in self.bands]
+    self.rows = {line: row for line, row in zip(lines, rows)}
+
+    state = self.writer.state
+    columns = max((len(row) for row in rows), default=0)
+    width, height = self.writer.canvas_size(state, columns, len(rows))
+    surface = surfaces.new_filled_surface(width, height, CW.BACKGROUND)
+    ctx = cairo.Context(surface)
+    if self.writer.draft:
+      ctx.set_source_rgb(*CW.DRAFT_INK)
+    else:
+      ctx.set_source(CW.ink_gradient(height))
+    pitch = state.YPAD + state.y_scaled
+    for i, row in enumerate(rows):
+      if row:
+        band, margin = self.band_for(row)
+        ctx.mask_surface(band, 0, i * pitch - margin)
+    self.bands = {row: self.bands[row] for row in set(rows) if row}
+    self.surface = surface
+    return self.dirty
+
+  def render_file(self, filename):
+    with open(filename, "r") as infile:
+      return self.render(infile.readlines())
+
+  def export_image(self, filename="output.png"):
+    self.surface.write_to_png(filename)
+
+
+def preview(infile="input.txt", outfile="output.png", style="curved",
+            scale=1, interval=0.25, draft=False):
+  renderer = IncrementalRenderer(scale, style, draft)
+  mtime = None
+  while True:
+    current = os.stat(infile).st_mtime_ns
+    if current != mtime:
+      mtime = current
+      dirty = renderer.render_file(infile)
+      renderer.export_image(outfile)
+      print("redrew", len(dirty), "rows")
+    time.sleep(interval)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+import cost
+import spell_cards
+import spells
+
+
+# Polls src/*.spl and the spell csv for changes and re-renders only the
+# cards that changed. The process stays up, so gradients, backgrounds and
+# compiled frame/sigil paths cached by spell_cards stay warm between saves.
+# Records with errors are reported and skipped. Cards are written to a
+# temporary name and moved into place, or taken from an OutputStore when
+# one is given.
+class Watcher:
+  def __init__(self,
+               indir="src",
+               csv_path="All_Spells.csv",
+               outdir="out",
+               scale=2,
+               jobs=1,
+               interval=0.5,
+               debounce=0.3,
+               draft=False,
+               store=None):
+    self.indir = indir
+    self.csv_path = csv_path
+    self.outdir = outdir
+    self.scale = scale
+    self.jobs = jobs
+    self.interval = interval
+    self.debounce = debounce
+    self.draft = draft
+    self.store = store
+    self.spl_mtimes = {}
+    self.csv_mtime = None
+    self.csv_rows = {}
+    self.pending = {}
+    self.last_change = 0
+
+  def scan_spl(self):
+    if not self.indir or not os.path.isdir(self.indir):
+      return []
+    changed = []
+    seen = {}
+    for filename in os.scandir(self.indir):
+      if filename.is_file() and filename.name.endswith(".spl"):
+        mtime = filename.stat().st_mtime_ns
+        seen[filename.path] = mtime
+        if self.spl_mtimes.get(filename.path) != mtime:
+          changed.append(filename.path)
+    self.spl_mtimes = seen
+    renders = []
+    for path in changed:
+      spell_dict = spells.read_spl(path)
+      if not self.valid(spell_dict):
+        continue
+      outname = os.path.basename(path).split('.')[0] + ".png"
+      renders.append((path, spell_dict,
+                      self.outdir + "/" + spell_dict.get("LEVEL", "") + "_" + outname))
+    return renders
+
+  def scan_csv(self):
+    if not self.csv_path or not os.path.isfile(self.csv_path):
+      return []
+    mtime = os.stat(self.csv_path).st_mtime_ns
+    if mtime == self.csv_mtime:
+      return []
+    self.csv_mtime = mtime
+    rows = spells.read_csv(self.csv_path)[1]
+    renders = [(self.csv_path + ":" + name, spell_dict,
+                os.path.join(self.outdir, spells.file_stem(name) + ".png"))
+               for name, spell_dict in rows.items()
+               if self.csv_rows.get(name) != spell_dict and self.valid(spell_dict)]
+    self.csv_rows = rows
+    return renders
+
+  def valid(self, spell_dict):
+    if spell_dict.errors:
+      print("skipped", spell_dict.get("NAME", "spell") + ":",
+            "; ".join(spell_dict.errors))
+    return not spell_dict.errors
+
+  def poll(self):
+    # a burst of saves keeps pushing the render back until the files have
+    # been quiet for the debounce period
+    changes = self.scan_spl() + self.scan_csv()
+    now = time.monotonic()
+    for key, spell_dict, filename in changes:
+      self.pending[key] = (spell_dict, filename)
+    if changes:
+      self.last_change = now
+    if not self.pending or now - self.last_change < self.debounce:
+      return []
+    renders = list(self.pending.values())
+    self.pending = {}
+    return renders
+
+  def render(self, renders):
+    done = []
+    with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+      futures = [(spell_dict, filename,
+                  pool.submit(self.render_spell, spell_dict, filename))
+                 for _, _, (spell_dict, filename) in cost.longest_first(
+                   renders, lambda job: cost.spell_cost(job[0], self.scale))]
+      for spell_dict, filename, future in futures:
+        try:
+          done.append(future.result())
+          print("rendered", filename)
+        except Exception as e:
+          print("failed", spell_dict.get("NAME", filename), e)
+    return done
+
+  def render_spell(self, spell_dict, filename):
+    if self.store is not None:
+      return self.store.render(spell_dict, filename, self.scale,
+                               draft=self.draft)
+    # a viewer reloading the card never sees it half written
+    stem, ext = os.path.splitext(filename)
+    tmp = "%s.%d.%d%s" % (stem, os.getpid(), threading.get_ident(), ext)
+    try:
+      spell_cards.render_spell(spell_dict, tmp, self.scale, draft=self.draft)
+      os.replace(tmp, filename)
+    finally:
+      if os.path.exists(tmp):
+        os.remove(tmp)
+    return filename
+
+  def run(self, cycles=None, initial=False):
+    os.makedirs(self.outdir, exist_ok=True)
+    if not initial:
+      # only edits made after startup are rendered
+      self.scan_spl()
+      self.scan_csv()
+    cycle = 0
+    while cycles is None or cycle < cycles:
+      renders = self.poll()
+      if renders:
+        self.render(renders)
+      time.sleep(self.interval)
+      cycle += 1